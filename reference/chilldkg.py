@@ -1,10 +1,16 @@
 # Reference implementation of BIP DKG.
-from typing import Tuple, List, Any, Union, Literal, Optional, NamedTuple
-
-from secp256k1ref.secp256k1 import Scalar
-from secp256k1ref.bip340 import schnorr_sign, schnorr_verify
+from typing import Tuple, List, Any, Union, Literal, Optional, NamedTuple, Dict
+
+from secp256k1ref.secp256k1 import GE, Scalar
+from secp256k1ref.scalarvec import ScalarVector
+from secp256k1ref.bip340 import (
+    schnorr_sign,
+    schnorr_batch_verify,
+    schnorr_batch_find_invalid,
+)
+from secp256k1ref.halfagg import aggregate, verify_aggregate
 from secp256k1ref.keys import pubkey_gen_plain
-from secp256k1ref.util import tagged_hash, int_from_bytes, bytes_from_int
+from secp256k1ref.util import tagged_hash, int_from_bytes
 from network import SignerChannel, CoordinatorChannels
 
 from vss import VSS, VSSCommitment
@@ -15,6 +21,7 @@ from util import (
     InvalidBackupError,
     DeserializationError,
     DuplicateHostpubkeyError,
+    InvalidContributionError,
 )
 
 
@@ -28,15 +35,68 @@ def certifying_eq_signer_step(hostseckey: bytes, x: bytes) -> bytes:
     return schnorr_sign(x, hostseckey, b"0" * 32)
 
 
-def certifying_eq_verify(hostpubkeys: List[bytes], x: bytes, cert: bytes) -> bool:
+def certifying_eq_verify(
+    hostpubkeys: List[bytes],
+    x: bytes,
+    cert: bytes,
+    hostpubkey_points: Optional[List[GE]] = None,
+) -> bool:
+    """Verify a certificate, which can be in plain (64*n bytes) or half-aggregated
+    (32*(n+1) bytes) format. For n = 1, both formats coincide.
+
+    If given, hostpubkey_points must be the decoded hostpubkeys."""
     n = len(hostpubkeys)
+    if len(cert) == 32 * (n + 1) and n != 1:
+        return verify_aggregate(
+            cert, [x] * n, [hostpubkey[1:33] for hostpubkey in hostpubkeys]
+        )
     if len(cert) != 64 * n:
         return False
-    is_valid = [
-        schnorr_verify(x, hostpubkeys[i][1:33], cert[i * 64 : (i + 1) * 64])
-        for i in range(n)
-    ]
-    return all(is_valid)
+    return schnorr_batch_verify(
+        [x] * n,
+        [hostpubkey[1:33] for hostpubkey in hostpubkeys],
+        [cert[i * 64 : (i + 1) * 64] for i in range(n)],
+        points=hostpubkey_points,
+    )
+
+
+def certifying_eq_invalid_signers(
+    hostpubkeys: List[bytes], x: bytes, cert: bytes
+) -> List[int]:
+    """Return the indices of the signers whose signature in cert is invalid.
+
+    Only certificates in plain format are supported, because invalid signers cannot be
+    identified in a half-aggregated certificate."""
+    n = len(hostpubkeys)
+    if len(cert) != 64 * n:
+        raise ValueError("The certificate must be a 64*n-byte array.")
+    return schnorr_batch_find_invalid(
+        [x] * n,
+        [hostpubkey[1:33] for hostpubkey in hostpubkeys],
+        [cert[i * 64 : (i + 1) * 64] for i in range(n)],
+    )
+
+
+def certifying_eq_blame(
+    hostpubkeys: List[bytes],
+    x: bytes,
+    cert: bytes,
+    hostpubkey_points: Optional[List[GE]] = None,
+) -> None:
+    """Like certifying_eq_verify, but raise InvalidContributionError if cert is invalid.
+
+    For a certificate in plain format, the signer with the first invalid signature is
+    blamed. Otherwise (wrong length or an invalid half-aggregated certificate), the
+    coordinator is blamed, indicated by signer None."""
+    if certifying_eq_verify(hostpubkeys, x, cert, hostpubkey_points):
+        return
+    if len(cert) == 64 * len(hostpubkeys):
+        invalid = certifying_eq_invalid_signers(hostpubkeys, x, cert)
+        if len(invalid) > 0:
+            raise InvalidContributionError(
+                invalid[0], "Participant sent invalid signature"
+            )
+    raise InvalidContributionError(None, "Coordinator sent invalid certificate")
 
 
 def certifying_eq_coordinator_step(sigs: List[bytes]) -> bytes:
@@ -44,6 +104,18 @@ def certifying_eq_coordinator_step(sigs: List[bytes]) -> bytes:
     return cert
 
 
+def certifying_eq_coordinator_step_aggregate(
+    hostpubkeys: List[bytes], x: bytes, sigs: List[bytes]
+) -> bytes:
+    """Build a half-aggregated certificate of 32*(n+1) bytes instead of 64*n bytes.
+
+    The signatures should be verified before aggregating them, because invalid signers cannot
+    be identified in the aggregate."""
+    return aggregate(
+        [x] * len(sigs), [hostpubkey[1:33] for hostpubkey in hostpubkeys], sigs
+    )
+
+
 ###
 ### Parameters and Setup
 ###
@@ -76,6 +148,72 @@ def session_params(
     return params, params_id
 
 
+class SessionContext(NamedTuple):
+    """Everything a signer derives from its seed and the session parameters.
+
+    A SessionContext is built once per session by session_context() and can be passed
+    to all signer steps, so that none of this data is derived again in every step."""
+
+    params: SessionParams
+    hostseckey: bytes
+    hostpubkey: bytes
+    idx: int
+    # Index of every hostpubkey in params.hostpubkeys
+    indices: Dict[bytes, int]
+    # Decoded hostpubkeys (None if not decoded, or if any of them is invalid)
+    hostpubkey_points: Optional[List[GE]]
+    # Output of encpedpop.session_seed
+    session_seed: bytes
+    enc_context: bytes
+
+
+def session_context(
+    seed: bytes, params: SessionParams, decode_hostpubkeys: bool = True
+) -> SessionContext:
+    """Derive the SessionContext of the signer with the given seed.
+
+    The hostpubkeys are decoded only if decode_hostpubkeys is set, which is worth it only
+    if the context is used to verify certificates more than once.
+
+    Raises ValueError if the hostpubkey derived from seed is not in params.hostpubkeys."""
+    hostseckey, hostpubkey = hostkey_gen(seed)
+    (hostpubkeys, t, _) = params
+    indices = {hostpubkey_: i for i, hostpubkey_ in enumerate(hostpubkeys)}
+    if hostpubkey not in indices:
+        raise ValueError(
+            "Hostpubkey derived from seed is not in the session parameters"
+        )
+    hostpubkey_points = None
+    if decode_hostpubkeys:
+        decoded = [GE.from_bytes_compressed(pk) for pk in hostpubkeys]
+        if all(P is not None for P in decoded):
+            hostpubkey_points = [P for P in decoded if P is not None]
+    seed_, enc_context = encpedpop.session_seed(seed, hostpubkeys, t)
+    return SessionContext(
+        params,
+        hostseckey,
+        hostpubkey,
+        indices[hostpubkey],
+        indices,
+        hostpubkey_points,
+        seed_,
+        enc_context,
+    )
+
+
+def check_session_context(
+    ctx: SessionContext, seed: bytes, params: SessionParams
+) -> None:
+    """Check that ctx is the SessionContext of the signer with the given seed and params.
+
+    Raises ValueError otherwise. Only the hostseckey is derived from seed again, which is
+    a single hash."""
+    if ctx.params != params:
+        raise ValueError("Session context and session parameters don't match")
+    if ctx.hostseckey != kdf(seed, "hostseckey"):
+        raise ValueError("Session context and seed don't match")
+
+
 ###
 ### Messages
 ###
@@ -88,7 +226,7 @@ class SignerMsg1(NamedTuple):
 
 class CoordinatorMsg(NamedTuple):
     enc_cmsg: encpedpop.CoordinatorMsg
-    enc_shares_sums: List[Scalar]
+    enc_shares_sums: ScalarVector
 
 
 # TODO: fix Any type
@@ -153,15 +291,24 @@ class Backup(NamedTuple):
     cert: bytes
 
 
-def signer_step1(seed: bytes, params: SessionParams) -> Tuple[SignerState1, SignerMsg1]:
-    hostseckey, hostpubkey = hostkey_gen(seed)
+def signer_step1(
+    seed: bytes, params: SessionParams, ctx: Optional[SessionContext] = None
+) -> Tuple[SignerState1, SignerMsg1]:
+    if ctx is None:
+        ctx = session_context(seed, params, decode_hostpubkeys=False)
+    else:
+        check_session_context(ctx, seed, params)
     (hostpubkeys, t, params_id) = params
 
-    signer_idx = hostpubkeys.index(hostpubkey)
     enc_state, enc_smsg = encpedpop.signer_step(
-        seed, t, hostseckey, hostpubkeys, signer_idx
+        seed,
+        t,
+        ctx.hostseckey,
+        hostpubkeys,
+        ctx.idx,
+        session=(ctx.session_seed, ctx.enc_context),
     )
-    state1 = SignerState1(params, signer_idx, enc_state)
+    state1 = SignerState1(params, ctx.idx, enc_state)
     return state1, SignerMsg1(enc_smsg)
 
 
@@ -169,9 +316,14 @@ def signer_step2(
     seed: bytes,
     state1: SignerState1,
     cmsg: CoordinatorMsg,
+    ctx: Optional[SessionContext] = None,
 ) -> Tuple[SignerState2, bytes]:
-    (hostseckey, _) = hostkey_gen(seed)
     (params, idx, enc_state) = state1
+    if ctx is None:
+        (hostseckey, _) = hostkey_gen(seed)
+    else:
+        check_session_context(ctx, seed, params)
+        hostseckey = ctx.hostseckey
     enc_cmsg, enc_shares_sums = cmsg
 
     # TODO Not sure if we need to include params_id as eta here. But it won't hurt.
@@ -183,18 +335,19 @@ def signer_step2(
     dkg_output, eta = encpedpop.signer_pre_finalize(
         enc_state, enc_cmsg, enc_shares_sums[idx]
     )
-    eta += b"".join([bytes_from_int(int(share)) for share in enc_shares_sums])
+    eta += enc_shares_sums.to_bytes()
     state2 = SignerState2(params, eta, dkg_output)
     return state2, certifying_eq_signer_step(hostseckey, eta)
 
 
 def signer_finalize(
-    state2: SignerState2, cert: bytes
-) -> Optional[Tuple[DKGOutput, Backup]]:
-    """A return value of None indicates that the DKG session has not completed
-    successfully from our point of view.
+    state2: SignerState2, cert: bytes, ctx: Optional[SessionContext] = None
+) -> Tuple[DKGOutput, Backup]:
+    """An InvalidContributionError indicates that the DKG session has not completed
+    successfully from our point of view. It blames the participant whose signature
+    in cert is invalid, or the coordinator (signer None) if cert is malformed.
 
-    WARNING: Even when obtaining a return value of None, you MUST NOT conclude
+    WARNING: Even when an InvalidContributionError is raised, you MUST NOT conclude
     that the DKG session has failed from the point of view of other
     participants, and as a consequence, you MUST NOT erase your seed.
 
@@ -205,34 +358,41 @@ def signer_finalize(
     success of the DKG session by presenting a public backup that is accepted by
     `signer_recover`."""
     (params, eta, dkg_output) = state2
-    if not certifying_eq_verify(params.hostpubkeys, eta, cert):
-        return None
+    hostpubkey_points = None
+    if ctx is not None:
+        if ctx.params != params:
+            raise ValueError("Session context and session parameters don't match")
+        hostpubkey_points = ctx.hostpubkey_points
+    certifying_eq_blame(params.hostpubkeys, eta, cert, hostpubkey_points)
     return dkg_output, Backup(eta, cert)
 
 
 async def signer(
     chan: SignerChannel, seed: bytes, hostseckey: bytes, params: SessionParams
-) -> Optional[Tuple[DKGOutput, Backup]]:
+) -> Tuple[DKGOutput, Backup]:
     # TODO Top-level error handling
-    state1, smsg1 = signer_step1(seed, params)
+    ctx = session_context(seed, params)
+    state1, smsg1 = signer_step1(seed, params, ctx)
     chan.send(smsg1)
     cmsg = await chan.receive()
 
-    state2, eq_round1 = signer_step2(seed, state1, cmsg)
+    state2, eq_round1 = signer_step2(seed, state1, cmsg, ctx)
 
     chan.send(eq_round1)
     cert = await chan.receive()
 
-    # TODO: If signer_finalize fails, we should probably not just return None
-    # but raise instead. Raising a specific exception is also better for
-    # testing.
-    return signer_finalize(state2, cert)
+    return signer_finalize(state2, cert, ctx)
 
 
 # Recovery requires the seed and the public backup
 def signer_recover(
-    seed: bytes, backup: Backup, context_string: bytes
+    seed: bytes,
+    backup: Backup,
+    context_string: bytes,
+    ctx: Optional[SessionContext] = None,
 ) -> Union[Tuple[DKGOutput, SessionParams], Literal[False]]:
+    """If given, ctx must be the SessionContext of the session of the backup, e.g., if the
+    signer still has it from running the session."""
     (eta, cert) = backup
     try:
         (t, sum_vss_commit, hostpubkeys, enc_shares_sums) = deserialize_eta(eta)
@@ -242,18 +402,23 @@ def signer_recover(
     n = len(hostpubkeys)
     (params, params_id) = session_params(hostpubkeys, t, context_string)
 
-    # Verify cert
-    certifying_eq_verify(hostpubkeys, eta, cert)
-
     # Find our hostpubkey
-    hostseckey, hostpubkey = hostkey_gen(seed)
-    try:
-        idx = hostpubkeys.index(hostpubkey)
-    except ValueError as e:
-        raise InvalidBackupError("Seed and backup don't match") from e
+    if ctx is None:
+        try:
+            ctx = session_context(seed, params, decode_hostpubkeys=False)
+        except ValueError as e:
+            raise InvalidBackupError("Seed and backup don't match") from e
+    elif ctx.params != params:
+        raise InvalidBackupError("Session context and backup don't match")
+    elif ctx.hostseckey != kdf(seed, "hostseckey"):
+        raise InvalidBackupError("Session context and seed don't match")
+    hostseckey, idx = ctx.hostseckey, ctx.idx
+
+    # Verify cert
+    certifying_eq_verify(hostpubkeys, eta, cert, ctx.hostpubkey_points)
 
     # Decrypt share
-    seed_, enc_context = encpedpop.session_seed(seed, hostpubkeys, t)
+    seed_, enc_context = ctx.session_seed, ctx.enc_context
     shares_sum = encpedpop.decrypt_sum(
         enc_shares_sums[idx], hostseckey, hostpubkeys, idx, enc_context
     )
@@ -264,7 +429,9 @@ def signer_recover(
     shares_sum += self_share
 
     # Compute threshold pubkey and individual pubshares
-    (threshold_pubkey, signer_pubshares) = common_dkg_output(sum_vss_commit, n)
+    (threshold_pubkey, signer_pubshares) = common_dkg_output(
+        sum_vss_commit, n, lazy=True
+    )
 
     dkg_output = DKGOutput(shares_sum, threshold_pubkey, signer_pubshares)
     return dkg_output, params
@@ -281,13 +448,15 @@ def coordinator_step(
     enc_cmsg, dkg_output, eta, enc_shares_sums = encpedpop.coordinator_step(
         [smsg1.enc_smsg for smsg1 in smsgs1], params.t, params.hostpubkeys
     )
-    eta += b"".join([bytes_from_int(int(share)) for share in enc_shares_sums])
+    eta += enc_shares_sums.to_bytes()
     return CoordinatorMsg(enc_cmsg, enc_shares_sums), dkg_output, eta
 
 
 async def coordinator(
-    chans: CoordinatorChannels, params: SessionParams
-) -> Optional[DKGOutput]:
+    chans: CoordinatorChannels, params: SessionParams, aggregate_cert: bool = False
+) -> DKGOutput:
+    """Raises InvalidContributionError for the first participant who sent an
+    invalid signature in the certifying equality check."""
     (hostpubkeys, t, params_id) = params
     n = len(hostpubkeys)
     smsgs1: List[SignerMsg1] = []
@@ -301,10 +470,13 @@ async def coordinator(
     for i in range(n):
         sigs += [await chans.receive_from(i)]
     cert = certifying_eq_coordinator_step(sigs)
+    # TODO This should probably go to a coordinator_finalize function
+    is_valid = certifying_eq_verify(hostpubkeys, eta, cert)
+    if aggregate_cert and is_valid:
+        cert = certifying_eq_coordinator_step_aggregate(hostpubkeys, eta, sigs)
     chans.send_all(cert)
 
-    # TODO This should probably go to a coordinator_finalize function
-    if not certifying_eq_verify(hostpubkeys, eta, cert):
-        return None
+    if not is_valid:
+        certifying_eq_blame(hostpubkeys, eta, cert)
 
     return dkg_output
@@ -1,7 +1,8 @@
-from typing import Tuple, List, NamedTuple
+from typing import Tuple, List, NamedTuple, Optional
 
 from secp256k1ref.secp256k1 import Scalar
-from secp256k1ref.ecdh import ecdh_raw
+from secp256k1ref.scalarvec import ScalarVector
+from secp256k1ref.ecdh import ecdh_compressed, ecdh_compressed_batch
 from secp256k1ref.util import int_from_bytes
 
 import simplpedpop
@@ -13,17 +14,27 @@ from util import tagged_hash_bip_dkg, InvalidContributionError
 ###
 
 
-def ecdh(deckey: bytes, enckey: bytes, context: bytes) -> Scalar:
-    shared_secret = ecdh_raw(deckey, enckey)
-    return Scalar(
-        int_from_bytes(
-            tagged_hash_bip_dkg("ECDH", shared_secret.to_bytes_compressed() + context)
-        )
-    )
+def ecdh(
+    deckey: bytes, enckey: bytes, context: bytes, my_enckey: Optional[bytes] = None
+) -> Scalar:
+    shared_secret = ecdh_compressed(deckey, enckey, my_enckey)
+    return Scalar(int_from_bytes(tagged_hash_bip_dkg("ECDH", shared_secret + context)))
 
 
-def encrypt(share: Scalar, deckey: bytes, enckey: bytes, context: bytes) -> Scalar:
-    return share + ecdh(deckey, enckey, context)
+def ecdh_batch(
+    deckey: bytes, my_enckey: bytes, enckeys: List[bytes], context: bytes
+) -> List[Optional[Scalar]]:
+    """Compute ecdh(deckey, enckey, context, my_enckey) for all enckeys at once.
+
+    The result is None for every invalid enckey."""
+    return [
+        None
+        if shared_secret is None
+        else Scalar(
+            int_from_bytes(tagged_hash_bip_dkg("ECDH", shared_secret + context))
+        )
+        for shared_secret in ecdh_compressed_batch(deckey, my_enckey, enckeys)
+    ]
 
 
 def decrypt_sum(
@@ -33,11 +44,12 @@ def decrypt_sum(
     idx: int,
     context: bytes,
 ) -> Scalar:
-    shares_sum = ciphertext_sum
-    for i in range(len(enckeys)):
-        if i != idx:
-            shares_sum = shares_sum - ecdh(deckey, enckeys[i], context)
-    return shares_sum
+    pads = ecdh_batch(deckey, enckeys[idx], enckeys[:idx] + enckeys[idx + 1 :], context)
+    # signer_step rejects invalid enckeys, but recovery takes them from a backup.
+    valid_pads = [pad for pad in pads if pad is not None]
+    if len(valid_pads) != len(pads):
+        raise ValueError("The public key is invalid.")
+    return ciphertext_sum - ScalarVector.from_scalars(valid_pads).total()
 
 
 ###
@@ -47,7 +59,7 @@ def decrypt_sum(
 
 class SignerMsg(NamedTuple):
     simpl_smsg: simplpedpop.SignerMsg
-    enc_shares: List[Scalar]
+    enc_shares: ScalarVector
 
 
 class CoordinatorMsg(NamedTuple):
@@ -66,6 +78,7 @@ class SignerState(NamedTuple):
     idx: int
     self_share: Scalar
     simpl_state: simplpedpop.SignerState  # TODO Move up?
+    enc_context: bytes
 
 
 def session_seed(seed, enckeys, t):
@@ -75,32 +88,47 @@ def session_seed(seed, enckeys, t):
 
 
 def signer_step(
-    seed: bytes, t: int, deckey: bytes, enckeys: List[bytes], signer_idx: int
+    seed: bytes,
+    t: int,
+    deckey: bytes,
+    enckeys: List[bytes],
+    signer_idx: int,
+    session: Optional[Tuple[bytes, bytes]] = None,
 ) -> Tuple[SignerState, SignerMsg]:
+    """If given, session must be session_seed(seed, enckeys, t), which then isn't
+    computed again."""
     assert t < 2 ** (4 * 8)
     n = len(enckeys)
 
     # Protect against reuse of seed in case we previously exported shares
     # encrypted under wrong enckeys.
-    seed_, enc_context = session_seed(seed, enckeys, t)
+    if session is None:
+        session = session_seed(seed, enckeys, t)
+    seed_, enc_context = session
 
     simpl_state, simpl_smsg, shares = simplpedpop.signer_step(seed_, t, n, signer_idx)
     assert len(shares) == n
-    enc_shares: List[Scalar] = []
-    for i in range(n):
-        if i == signer_idx:
-            # TODO No need to send a constant.
-            enc_shares.append(Scalar(0))
-        else:
-            try:
-                enc_shares.append(encrypt(shares[i], deckey, enckeys[i], enc_context))
-            except ValueError:  # Invalid enckeys[i]
-                raise InvalidContributionError(
-                    i, "Participant sent invalid encryption key"
-                )
+    # Compute the pads for all other participants at once
+    pads = ScalarVector.zeros(n)
+    others = [i for i in range(n) if i != signer_idx]
+    for i, pad in zip(
+        others,
+        ecdh_batch(
+            deckey, enckeys[signer_idx], [enckeys[i] for i in others], enc_context
+        ),
+    ):
+        if pad is None:  # Invalid enckeys[i]
+            raise InvalidContributionError(i, "Participant sent invalid encryption key")
+        pads[i] = pad
+    # Encrypt all shares at once
+    enc_shares = shares + pads
+    # TODO No need to send a constant.
+    enc_shares[signer_idx] = 0
     self_share = shares[signer_idx]
     smsg = SignerMsg(simpl_smsg, enc_shares)
-    state = SignerState(t, deckey, enckeys, signer_idx, self_share, simpl_state)
+    state = SignerState(
+        t, deckey, enckeys, signer_idx, self_share, simpl_state, enc_context
+    )
     return state, smsg
 
 
@@ -109,10 +137,9 @@ def signer_pre_finalize(
     cmsg: CoordinatorMsg,
     enc_shares_sum: Scalar,
 ) -> Tuple[simplpedpop.DKGOutput, bytes]:
-    t, deckey, enckeys, idx, self_share, simpl_state = state
+    t, deckey, enckeys, idx, self_share, simpl_state, enc_context = state
     simpl_cmsg, = cmsg  # Unpack unary tuple  # fmt: skip
 
-    enc_context = t.to_bytes(4, byteorder="big") + b"".join(enckeys)
     shares_sum = decrypt_sum(enc_shares_sum, deckey, enckeys, idx, enc_context)
     shares_sum += self_share
     dkg_output, eta = simplpedpop.signer_pre_finalize(
@@ -131,14 +158,13 @@ def coordinator_step(
     smsgs: List[SignerMsg],
     t: int,
     enckeys: List[bytes],
-) -> Tuple[CoordinatorMsg, simplpedpop.DKGOutput, bytes, List[Scalar]]:
+) -> Tuple[CoordinatorMsg, simplpedpop.DKGOutput, bytes, ScalarVector]:
     n = len(smsgs)
     simpl_cmsg, dkg_output, eta = simplpedpop.coordinator_step(
         [smsg.simpl_smsg for smsg in smsgs], t, n
     )
-    enc_shares_sums = [
-        Scalar.sum(*([smsg.enc_shares[i] for smsg in smsgs])) for i in range(n)
-    ]
+    # Sum the i-th encrypted shares of all participants, for every i
+    enc_shares_sums = ScalarVector.sum(*(smsg.enc_shares for smsg in smsgs))
     eta += b"".join(enckeys)
     # In pure EncPedPop, the coordinator wants to send enc_shares_sums[i] to each
     # participant i. Broadcasting the entire array to everyone is not necessary, so we
@@ -0,0 +1,61 @@
+from typing import Sequence
+
+from secp256k1ref import backend
+from secp256k1ref.secp256k1 import GE, Scalar
+from secp256k1ref.scalarvec import ScalarVector
+from secp256k1ref.util import LRUCache
+
+
+# Cache of Lagrange coefficients, keyed by the sorted tuple of signer indices. Signing sessions
+# typically involve the same sets of signers over and over again. Used with the fast backend.
+LAGRANGE_CACHE = LRUCache(1024)
+
+
+def _lagrange_coeffs_sorted(idxs: Sequence[int]) -> ScalarVector:
+    # With x_i = idxs[i] + 1 and P = x_0 * ... * x_{t-1}, the coefficient of the i-th signer
+    # for interpolating at 0 is lambda_i = prod_{j != i} x_j / (x_j - x_i) = P / (x_i * d_i),
+    # where d_i = prod_{j != i} (x_j - x_i). All denominators are inverted at once.
+    xs = [i + 1 for i in idxs]
+    prod = 1
+    dens = []
+    for x_i in xs:
+        prod = prod * x_i % Scalar.SIZE
+        d_i = x_i
+        for x_j in xs:
+            if x_j != x_i:
+                d_i = d_i * (x_j - x_i) % Scalar.SIZE
+        dens.append(d_i)
+    return ScalarVector(dens).inverse() * prod
+
+
+def lagrange_coeffs(idxs: Sequence[int]) -> ScalarVector:
+    """Return the Lagrange coefficients for interpolating at 0 from the signers with indices idxs.
+
+    The share of the signer with index i is f(i+1). The coefficients are returned in the order of
+    idxs, such that f(0) = sum(coeffs[k] * f(idxs[k]+1))."""
+    if len(set(idxs)) != len(idxs):
+        raise ValueError("The signer indices must be distinct.")
+    if any(i < 0 for i in idxs):
+        raise ValueError("The signer indices must be non-negative.")
+    key = tuple(sorted(idxs))
+    if backend.is_fast():
+        coeffs = LAGRANGE_CACHE.get_or_compute(
+            key, lambda: tuple(_lagrange_coeffs_sorted(key).values())
+        )
+    else:
+        coeffs = tuple(_lagrange_coeffs_sorted(key).values())
+    position = {i: k for k, i in enumerate(key)}
+    return ScalarVector(coeffs[position[i]] for i in idxs)
+
+
+def interpolate_scalars(idxs: Sequence[int], values: Sequence[Scalar]) -> Scalar:
+    """Recover f(0) from the values f(idxs[k]+1) of a polynomial f of degree < len(idxs)."""
+    assert len(idxs) == len(values)
+    return (lagrange_coeffs(idxs) * ScalarVector.from_scalars(values)).total()
+
+
+def interpolate_points(idxs: Sequence[int], points: Sequence[GE]) -> GE:
+    """Recover F(0) from the values F(idxs[k]+1) of a polynomial F of degree < len(idxs) in the
+    exponent, e.g., the threshold pubkey from the pubshares of signers with indices idxs."""
+    assert len(idxs) == len(points)
+    return GE.batch_mul(*zip(lagrange_coeffs(idxs).values(), points))
@@ -0,0 +1,63 @@
+"""Selection of the algorithms behind the secp256k1ref primitives
+
+All group operations (including the multi-scalar multiplication GE.batch_mul), and thus also
+BIP340 signing and verification, ECDH and everything built on top, are implemented by one of
+the following backends:
+
+* REFERENCE: Straightforward textbook algorithms, e.g., double-and-add with affine group
+  operations. This is the default, and it serves as the oracle for the fast backend.
+* FAST: Optimized pure-Python algorithms, e.g., Jacobian coordinates, Strauss' and Pippenger's
+  multi-scalar multiplication with the GLV endomorphism, and fixed-base tables.
+
+Both backends produce identical results. The backend can be selected with the environment
+variable SECP256K1REF_BACKEND, or at runtime with set_backend() or use_backend().
+
+The representation of field elements is independent of the backend, and is selected with the
+environment variable SECP256K1REF_FIELD at import time (see secp256k1.py).
+"""
+
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+REFERENCE = "reference"
+FAST = "fast"
+BACKENDS = (REFERENCE, FAST)
+
+
+def _check_backend(name: str) -> str:
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown secp256k1ref backend {name!r}, expected one of {BACKENDS}"
+        )
+    return name
+
+
+_backend = _check_backend(os.environ.get("SECP256K1REF_BACKEND", REFERENCE))
+
+
+def get_backend() -> str:
+    """Return the name of the selected backend."""
+    return _backend
+
+
+def set_backend(name: str) -> None:
+    """Select the backend with the given name."""
+    global _backend
+    _backend = _check_backend(name)
+
+
+def is_fast() -> bool:
+    """Return whether the fast backend is selected."""
+    return _backend == FAST
+
+
+@contextmanager
+def use_backend(name: str) -> Iterator[None]:
+    """Select the backend with the given name for the duration of a with statement."""
+    previous = get_backend()
+    set_backend(name)
+    try:
+        yield
+    finally:
+        set_backend(previous)
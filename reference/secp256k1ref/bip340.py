@@ -1,8 +1,89 @@
 # The following functions are based on the BIP-340 reference implementation:
 # https://github.com/bitcoin/bips/blob/master/bip-0340/reference.py
 
+from typing import List, Optional, Sequence, Tuple
+
+from . import backend
 from .secp256k1 import FE, GE, G
-from .util import int_from_bytes, bytes_from_int, xor_bytes, tagged_hash
+from .util import (
+    int_from_bytes,
+    bytes_from_int,
+    xor_bytes,
+    tagged_hash,
+    tagged_hasher,
+    hash_sha256,
+    LRUCache,
+    CacheStats,
+    read_checksummed,
+    write_checksummed,
+)
+
+
+class VerifiedSignatureCache:
+    """A bounded set of (msg, pubkey, sig) triples that are known to be valid signatures.
+
+    Only successful verifications are recorded, keyed by a digest of the triple, so a hit allows
+    skipping the verification altogether. The cache can be saved to and loaded from a file, which
+    must be trusted: a tampered file can make invalid signatures appear valid."""
+
+    MAGIC = b"SECPSIG\x00"
+
+    def __init__(self, maxsize: int = 16384):
+        self._cache = LRUCache(maxsize)
+
+    @staticmethod
+    def key(msg: bytes, pubkey: bytes, sig: bytes) -> bytes:
+        h = tagged_hasher("secp256k1ref/verified signature")
+        h.update(pubkey)
+        h.update(sig)
+        h.update(msg)
+        return h.digest()
+
+    def contains(self, msg: bytes, pubkey: bytes, sig: bytes) -> bool:
+        return self._cache.get(self.key(msg, pubkey, sig), False)
+
+    def add(self, msg: bytes, pubkey: bytes, sig: bytes) -> None:
+        self._cache.put(self.key(msg, pubkey, sig), True)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def stats(self) -> CacheStats:
+        return self._cache.stats()
+
+    def save(self, path: str) -> None:
+        """Write the cache to a file (atomically, see write_checksummed)."""
+        entries = b"".join(key for key in self._cache.keys() if isinstance(key, bytes))
+        write_checksummed(path, self.MAGIC, entries)
+
+    def load(self, path: str) -> bool:
+        """Add the entries of a file written by save(), and return whether it was valid."""
+        entries = read_checksummed(path, self.MAGIC, 32)
+        if entries is None:
+            return False
+        for i in range(0, len(entries), 32):
+            self._cache.put(entries[i : i + 32], True)
+        return True
+
+
+# Signatures verified successfully by schnorr_verify, schnorr_batch_verify and
+# schnorr_batch_find_invalid with the fast backend. Retried sessions and recoveries verify
+# the same signatures again, which is then almost free.
+VERIFIED_SIGS = VerifiedSignatureCache()
+
+
+def challenge(r: bytes, pubkey: bytes, msg: bytes) -> int:
+    """Compute the challenge e = int(hash_BIP0340/challenge(r || pubkey || msg)) mod n.
+
+    The (possibly long) message is fed to the hash function without copying it."""
+    h = tagged_hasher("BIP0340/challenge")
+    h.update(r)
+    h.update(pubkey)
+    h.update(msg)
+    return int_from_bytes(h.digest()) % GE.ORDER
 
 
 def pubkey_gen(seckey: bytes) -> bytes:
@@ -24,23 +105,16 @@ def schnorr_sign(msg: bytes, seckey: bytes, aux_rand: bytes) -> bytes:
     assert not P.infinity
     d = d0 if P.has_even_y() else GE.ORDER - d0
     t = xor_bytes(bytes_from_int(d), tagged_hash("BIP0340/aux", aux_rand))
-    k0 = (
-        int_from_bytes(tagged_hash("BIP0340/nonce", t + P.to_bytes_xonly() + msg))
-        % GE.ORDER
-    )
+    h = tagged_hasher("BIP0340/nonce")
+    h.update(t + P.to_bytes_xonly())
+    h.update(msg)
+    k0 = int_from_bytes(h.digest()) % GE.ORDER
     if k0 == 0:
         raise RuntimeError("Failure. This happens only with negligible probability.")
     R = k0 * G
     assert not R.infinity
     k = k0 if R.has_even_y() else GE.ORDER - k0
-    e = (
-        int_from_bytes(
-            tagged_hash(
-                "BIP0340/challenge", R.to_bytes_xonly() + P.to_bytes_xonly() + msg
-            )
-        )
-        % GE.ORDER
-    )
+    e = challenge(R.to_bytes_xonly(), P.to_bytes_xonly(), msg)
     sig = R.to_bytes_xonly() + bytes_from_int((k + e * d) % GE.ORDER)
     assert schnorr_verify(msg, P.to_bytes_xonly(), sig)
     return sig
@@ -51,16 +125,155 @@ def schnorr_verify(msg: bytes, pubkey: bytes, sig: bytes) -> bool:
         raise ValueError("The public key must be a 32-byte array.")
     if len(sig) != 64:
         raise ValueError("The signature must be a 64-byte array.")
-    P = GE.lift_x(int_from_bytes(pubkey))
+    fast = backend.is_fast()
+    if fast and VERIFIED_SIGS.contains(msg, pubkey, sig):
+        return True
+    P = GE.from_bytes_xonly(pubkey)
     r = int_from_bytes(sig[0:32])
     s = int_from_bytes(sig[32:64])
     if (P is None) or (r >= FE.SIZE) or (s >= GE.ORDER):
         return False
-    e = (
-        int_from_bytes(tagged_hash("BIP0340/challenge", sig[0:32] + pubkey + msg))
-        % GE.ORDER
-    )
+    e = challenge(sig[0:32], pubkey, msg)
     R = s * G - e * P
     if R.infinity or (not R.has_even_y()) or (R.x != r):
         return False
+    if fast:
+        VERIFIED_SIGS.add(msg, pubkey, sig)
+    return True
+
+
+def _batch_item(
+    msg: bytes, pubkey: bytes, sig: bytes, P: Optional[GE] = None
+) -> Optional[Tuple[GE, GE, int, int]]:
+    """Decode a signature for batch verification into (P, R, s, e), or None if invalid.
+
+    If P is given, it must be the already-decoded pubkey (with either y coordinate), which saves
+    the square root needed to decode it."""
+    if len(pubkey) != 32:
+        raise ValueError("The public key must be a 32-byte array.")
+    if len(sig) != 64:
+        raise ValueError("The signature must be a 64-byte array.")
+    if P is None:
+        P = GE.from_bytes_xonly(pubkey)
+    elif not P.has_even_y():
+        P = -P
+    r = int_from_bytes(sig[0:32])
+    s = int_from_bytes(sig[32:64])
+    if (P is None) or (r >= FE.SIZE) or (s >= GE.ORDER):
+        return None
+    R = GE.lift_x(r)
+    if R is None:
+        return None
+    return P, R, s, challenge(sig[0:32], pubkey, msg)
+
+
+def _batch_seed(
+    msgs: Sequence[bytes], pubkeys: Sequence[bytes], sigs: Sequence[bytes]
+) -> bytes:
+    """Derive the seed for the batch randomizers from all inputs, as suggested by BIP340."""
+    h = tagged_hasher("BIP0340/batch")
+    for msg, pubkey, sig in zip(msgs, pubkeys, sigs):
+        h.update(pubkey)
+        h.update(sig)
+        h.update(len(msg).to_bytes(8, "big"))
+        h.update(msg)
+    return h.digest()
+
+
+def _batch_randomizer(seed: bytes, i: int) -> int:
+    """Return the randomizer a_i in range 1..n-1 (with a_0 = 1)."""
+    if i == 0:
+        return 1
+    return int_from_bytes(hash_sha256(seed + i.to_bytes(4, "big"))) % (GE.ORDER - 1) + 1
+
+
+def _batch_check(
+    items: Sequence[Tuple[int, Tuple[GE, GE, int, int]]], seed: bytes
+) -> bool:
+    """Check sum(a_i*s_i)*G == sum(a_i*R_i + (a_i*e_i)*P_i) for the given (i, (P, R, s, e))."""
+    s_sum = 0
+    terms = []
+    for i, (P, R, s, e) in items:
+        a = _batch_randomizer(seed, i)
+        s_sum += a * s
+        terms += [(a, R), (a * e, P)]
+    return GE.batch_mul((-s_sum, G), *terms).infinity
+
+
+def schnorr_batch_find_invalid(
+    msgs: Sequence[bytes],
+    pubkeys: Sequence[bytes],
+    sigs: Sequence[bytes],
+    points: Optional[Sequence[GE]] = None,
+) -> List[int]:
+    """Return the indices of all invalid signatures (an empty list if all are valid).
+
+    With the fast backend, all signatures are first checked at once with a single multi-scalar
+    multiplication over a random linear combination, as described in BIP340. If that check
+    fails, the signatures are bisected into halves which are checked recursively, to identify the
+    invalid ones.
+
+    Callers that already hold the public keys as (non-infinity) group elements can pass them as
+    points, in which case pubkeys[i] must be points[i].to_bytes_xonly()."""
+    u = len(msgs)
+    assert len(pubkeys) == u and len(sigs) == u
+    assert points is None or len(points) == u
+    if not backend.is_fast():
+        return [i for i in range(u) if not schnorr_verify(msgs[i], pubkeys[i], sigs[i])]
+
+    invalid = []
+    items = []
+    for i in range(u):
+        if VERIFIED_SIGS.contains(msgs[i], pubkeys[i], sigs[i]):
+            continue
+        P = None if points is None else points[i]
+        item = _batch_item(msgs[i], pubkeys[i], sigs[i], P)
+        if item is None:
+            invalid.append(i)
+        else:
+            items.append((i, item))
+    seed = _batch_seed(msgs, pubkeys, sigs)
+
+    def bisect(items):
+        if len(items) == 0 or _batch_check(items, seed):
+            return []
+        if len(items) == 1:
+            return [items[0][0]]
+        mid = len(items) // 2
+        return bisect(items[:mid]) + bisect(items[mid:])
+
+    culprits = set(bisect(items))
+    for i, _ in items:
+        if i not in culprits:
+            VERIFIED_SIGS.add(msgs[i], pubkeys[i], sigs[i])
+    return sorted(invalid + list(culprits))
+
+
+def schnorr_batch_verify(
+    msgs: Sequence[bytes],
+    pubkeys: Sequence[bytes],
+    sigs: Sequence[bytes],
+    points: Optional[Sequence[GE]] = None,
+) -> bool:
+    """Verify multiple signatures; equivalent to all(schnorr_verify(...)) but faster.
+
+    The optional points are the decoded pubkeys, see schnorr_batch_find_invalid."""
+    u = len(msgs)
+    assert len(pubkeys) == u and len(sigs) == u
+    assert points is None or len(points) == u
+    if not backend.is_fast():
+        return all(schnorr_verify(msgs[i], pubkeys[i], sigs[i]) for i in range(u))
+    items = []
+    for i in range(u):
+        if VERIFIED_SIGS.contains(msgs[i], pubkeys[i], sigs[i]):
+            continue
+        P = None if points is None else points[i]
+        item = _batch_item(msgs[i], pubkeys[i], sigs[i], P)
+        if item is None:
+            return False
+        items.append((i, item))
+    if not _batch_check(items, _batch_seed(msgs, pubkeys, sigs)):
+        return False
+    for i, _ in items:
+        VERIFIED_SIGS.add(msgs[i], pubkeys[i], sigs[i])
     return True
@@ -1,6 +1,15 @@
 import hashlib
+from typing import List, Optional, Sequence
 
+from . import backend
 from .secp256k1 import GE, Scalar
+from .util import (
+    CacheStats,
+    LRUCache,
+    read_checksummed,
+    tagged_hash,
+    write_checksummed,
+)
 
 
 def ecdh_raw(seckey: bytes, pubkey: bytes):
@@ -8,11 +17,144 @@ def ecdh_raw(seckey: bytes, pubkey: bytes):
     x = Scalar.from_bytes(seckey)
     assert x != 0
     Y = GE.from_bytes_compressed(pubkey)
+    if Y is None:
+        raise ValueError("The public key is invalid.")
     Z = x * Y
     assert not Z.infinity
     return Z
 
 
+def ecdh_raw_batch(seckey: bytes, pubkeys: Sequence[bytes]) -> List[Optional[GE]]:
+    """Compute ecdh_raw(seckey, pubkey) for many pubkeys at once.
+
+    The result is None for every invalid pubkey. The multiplications by the same secret key
+    share the recoding of the key and the normalization of the results, see
+    GE.batch_mul_fixed_scalar."""
+    x = Scalar.from_bytes(seckey)
+    assert x != 0
+    Ys = [GE.from_bytes_compressed(pubkey) for pubkey in pubkeys]
+    Zs = iter(GE.batch_mul_fixed_scalar(x, [Y for Y in Ys if Y is not None]))
+    return [None if Y is None else next(Zs) for Y in Ys]
+
+
+class SharedPointCache:
+    """A bounded cache of ECDH shared points seckey * pubkey.
+
+    A party using the same key pair in many sessions needs to compute the shared point with each
+    peer only once. Entries are keyed by (own pubkey, peer pubkey, digest of the seckey), so that
+    a seckey that does not belong to the given own pubkey never hits. The encoded shared points
+    are kept in bytearrays, which are zeroized when they leave the cache.
+
+    The cache can be saved to and loaded from a file, which contains secret data and is thus
+    created with permissions 0o600."""
+
+    MAGIC = b"DKGECDH\x00"
+    ENTRY_SIZE = 33 + 33 + 32 + 33
+
+    def __init__(self, maxsize: int = 4096):
+        self._cache = LRUCache(maxsize, on_evict=self._zeroize)
+
+    @staticmethod
+    def _zeroize(key, point) -> None:
+        point[:] = bytes(len(point))
+
+    @staticmethod
+    def _seckey_digest(seckey: bytes) -> bytes:
+        return tagged_hash("secp256k1ref/ECDH cache seckey", seckey)
+
+    def get_or_compute(self, seckey: bytes, my_pubkey: bytes, pubkey: bytes) -> bytes:
+        """Return the compressed encoding of seckey * pubkey, where seckey belongs to my_pubkey."""
+        key = (my_pubkey, pubkey, self._seckey_digest(seckey))
+        # Copy the point while the cache is locked, as it is zeroized when evicted.
+        cached = self._cache.get(key, copy=bytes)
+        if cached is not None:
+            return cached
+        point = ecdh_raw(seckey, pubkey).to_bytes_compressed()
+        self._cache.put(key, bytearray(point))
+        return point
+
+    def get_or_compute_batch(
+        self, seckey: bytes, my_pubkey: bytes, pubkeys: Sequence[bytes]
+    ) -> List[Optional[bytes]]:
+        """Like get_or_compute for many pubkeys, with None for invalid pubkeys.
+
+        All shared points which are not cached yet are computed together (see ecdh_raw_batch)."""
+        digest = self._seckey_digest(seckey)
+        keys = [(my_pubkey, pubkey, digest) for pubkey in pubkeys]
+        points: List[Optional[bytes]] = [
+            self._cache.get(key, copy=bytes) for key in keys
+        ]
+        missing = [k for k in range(len(keys)) if points[k] is None]
+        Zs = ecdh_raw_batch(seckey, [pubkeys[k] for k in missing])
+        for k, Z in zip(missing, Zs):
+            if Z is not None:
+                point = Z.to_bytes_compressed()
+                self._cache.put(keys[k], bytearray(point))
+                points[k] = point
+        return points
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def stats(self) -> CacheStats:
+        return self._cache.stats()
+
+    def save(self, path: str) -> None:
+        """Write the cache to a file (atomically, see write_checksummed)."""
+        entries = bytearray()
+        for (my_pubkey, pubkey, digest), point in self._cache.items(copy=bytes):
+            entries += my_pubkey + pubkey + digest + point
+        try:
+            write_checksummed(path, self.MAGIC, entries, mode=0o600)
+        finally:
+            entries[:] = bytes(len(entries))
+
+    def load(self, path: str) -> bool:
+        """Add the entries of a file written by save(), and return whether it was valid."""
+        entries = read_checksummed(path, self.MAGIC, self.ENTRY_SIZE)
+        if entries is None:
+            return False
+        for i in range(0, len(entries), self.ENTRY_SIZE):
+            entry = entries[i : i + self.ENTRY_SIZE]
+            self._cache.put(
+                (entry[0:33], entry[33:66], entry[66:98]), bytearray(entry[98:131])
+            )
+        return True
+
+
+# Shared points computed by ecdh_compressed and ecdh_compressed_batch with the fast backend
+SHARED_POINTS = SharedPointCache()
+
+
+def ecdh_compressed(
+    seckey: bytes, pubkey: bytes, my_pubkey: Optional[bytes] = None
+) -> bytes:
+    """Return the compressed encoding of ecdh_raw(seckey, pubkey).
+
+    With the fast backend, the result is cached in SHARED_POINTS if my_pubkey, the public key
+    belonging to seckey, is given."""
+    if backend.is_fast() and my_pubkey is not None:
+        return SHARED_POINTS.get_or_compute(seckey, my_pubkey, pubkey)
+    return ecdh_raw(seckey, pubkey).to_bytes_compressed()
+
+
+def ecdh_compressed_batch(
+    seckey: bytes, my_pubkey: bytes, pubkeys: Sequence[bytes]
+) -> List[Optional[bytes]]:
+    """Compute ecdh_compressed(seckey, pubkey, my_pubkey) for many pubkeys at once.
+
+    The result is None for every invalid pubkey."""
+    if backend.is_fast():
+        return SHARED_POINTS.get_or_compute_batch(seckey, my_pubkey, pubkeys)
+    return [
+        None if Z is None else Z.to_bytes_compressed()
+        for Z in ecdh_raw_batch(seckey, pubkeys)
+    ]
+
+
 def ecdh_libsecp256k1(seckey: bytes, pubkey: bytes):
     """TODO"""
     Z = ecdh_raw(seckey, pubkey)
@@ -0,0 +1,124 @@
+"""Vectors of secp256k1 scalars
+
+A ScalarVector holds a sequence of scalars as plain integers reduced modulo the group order, and
+supports element-wise arithmetic on whole vectors. Bulk operations over many participants (or
+many sessions) can thus be written as a few vector operations, without allocating a Scalar
+object for every intermediate result.
+"""
+
+from typing import Iterable, Iterator, List, Sequence, Union
+
+from .secp256k1 import Scalar, _batch_inverse
+
+# An operand of element-wise arithmetic: another vector of the same length, or a single scalar
+# which is applied to every element.
+Operand = Union["ScalarVector", Scalar, int]
+
+
+class ScalarVector:
+    """A mutable vector of scalars (integers modulo the group order)."""
+
+    __slots__ = ("_values",)
+
+    def __init__(self, values: Iterable[int] = ()):
+        """Initialize a vector from integers (which are reduced modulo the group order)."""
+        self._values = [v % Scalar.SIZE for v in values]
+
+    @staticmethod
+    def from_scalars(scalars: Iterable[Scalar]) -> "ScalarVector":
+        """Initialize a vector from Scalar objects."""
+        return ScalarVector(int(s) for s in scalars)
+
+    @staticmethod
+    def zeros(n: int) -> "ScalarVector":
+        """Return the vector of n zeros."""
+        return ScalarVector([0] * n)
+
+    @staticmethod
+    def sum(*vs: "ScalarVector") -> "ScalarVector":
+        """Compute the element-wise sum of vectors of equal length.
+
+        ScalarVector.sum(a, b, c, ...) is identical to (a + b + c + ...). For a list of rows,
+        this computes the column sums."""
+        assert len(vs) > 0
+        assert all(len(v) == len(vs[0]) for v in vs)
+        return ScalarVector(sum(column) for column in zip(*(v._values for v in vs)))
+
+    def total(self) -> Scalar:
+        """Compute the sum of all elements of this vector."""
+        return Scalar(sum(self._values))
+
+    def values(self) -> List[int]:
+        """Return the elements of this vector as integers in range 0..ORDER-1."""
+        return list(self._values)
+
+    def _operand_values(self, a: Operand) -> Sequence[int]:
+        if isinstance(a, ScalarVector):
+            assert len(a) == len(self)
+            return a._values
+        return [int(a)] * len(self)
+
+    def __add__(self, a: Operand) -> "ScalarVector":
+        """Compute the element-wise sum with a vector or a scalar."""
+        return ScalarVector(
+            x + y for x, y in zip(self._values, self._operand_values(a))
+        )
+
+    def __radd__(self, a: Operand) -> "ScalarVector":
+        return self + a
+
+    def __sub__(self, a: Operand) -> "ScalarVector":
+        """Compute the element-wise difference with a vector or a scalar."""
+        return ScalarVector(
+            x - y for x, y in zip(self._values, self._operand_values(a))
+        )
+
+    def __rsub__(self, a: Operand) -> "ScalarVector":
+        return -self + a
+
+    def __mul__(self, a: Operand) -> "ScalarVector":
+        """Compute the element-wise product with a vector or a scalar."""
+        return ScalarVector(
+            x * y for x, y in zip(self._values, self._operand_values(a))
+        )
+
+    def __rmul__(self, a: Operand) -> "ScalarVector":
+        return self * a
+
+    def __neg__(self) -> "ScalarVector":
+        """Negate every element."""
+        return ScalarVector(-x for x in self._values)
+
+    def inverse(self) -> "ScalarVector":
+        """Compute the element-wise inverse of a vector of non-zero scalars.
+
+        This requires a single modular inversion in total (Montgomery's trick)."""
+        assert all(v != 0 for v in self._values)
+        return ScalarVector(_batch_inverse(self._values, Scalar.SIZE))
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __getitem__(self, i: int) -> Scalar:
+        return Scalar(self._values[i])
+
+    def __setitem__(self, i: int, value: Union[Scalar, int]) -> None:
+        self._values[i] = int(value) % Scalar.SIZE
+
+    def __iter__(self) -> Iterator[Scalar]:
+        return (Scalar(v) for v in self._values)
+
+    def __eq__(self, a: object) -> bool:
+        """Check whether this vector has the same elements as another vector or list of scalars."""
+        if isinstance(a, ScalarVector):
+            return self._values == a._values
+        if isinstance(a, (list, tuple)):
+            return len(a) == len(self) and all(x == y for x, y in zip(self, a))
+        return NotImplemented
+
+    def to_bytes(self) -> bytes:
+        """Convert to the concatenation of the 32-byte encodings (BE byte order) of all elements."""
+        return b"".join(v.to_bytes(32, "big") for v in self._values)
+
+    def __repr__(self) -> str:
+        return f"ScalarVector([{', '.join(f'0x{v:x}' for v in self._values)}])"
@@ -11,10 +11,85 @@ anything but tests.
 
 Exports:
 * FE: class for secp256k1 field elements
+* Scalar: class for secp256k1 scalars (integers modulo the group order)
 * GE: class for secp256k1 group elements
 * G: the secp256k1 generator point
+
+FE and Scalar are implemented on top of either APrimeFE (numerator / denominator form, the
+default) or APrimeIntFE (reduced integers, with a denominator only after divisions). The
+implementation is selected at import time by setting the environment variable
+SECP256K1REF_FIELD to "fraction" or "int"; both behave identically, so no call site needs to be
+aware of the choice.
+
+Group operations are implemented with straightforward algorithms by default, and with optimized
+ones if the fast backend is selected (see backend.py). The precomputed tables used by the fast
+backend are built on first use. If the environment variable SECP256K1REF_TABLE_DIR is set, they
+are additionally cached in files in that directory, and later processes map them into memory
+instead of recomputing them. Loaded tables are checked to consist of points on the curve, and a
+few random entries are compared against recomputed ones, but this cannot detect all tampering:
+the directory must be trusted, because whoever can write to it can control the results of all
+multiplications by G (public keys, nonces and signatures).
 """
 
+import os
+
+from . import backend
+from .util import LRUCache, read_checksummed, write_checksummed
+
+
+def _batch_inverse(xs, m):
+    """Compute the inverses of all (non-zero) integers in xs modulo m with a single inversion.
+
+    This uses Montgomery's trick: with prefix products c[i] = xs[0] * ... * xs[i], we have
+    1/xs[i] = c[i-1] * (1/c[i]), and 1/c[i-1] = xs[i] * (1/c[i])."""
+    prefix = []
+    acc = 1
+    for x in xs:
+        prefix.append(acc)
+        acc = acc * x % m
+    acc_inv = pow(acc, -1, m)
+    inverses = [0] * len(xs)
+    for i in range(len(xs) - 1, -1, -1):
+        inverses[i] = prefix[i] * acc_inv % m
+        acc_inv = acc_inv * xs[i] % m
+    return inverses
+
+
+def _affine_batch_add(ps, qs):
+    """Compute the element-wise sums of affine points given as (x, y) integer pairs (or None
+    for infinity), using a single inversion for the slopes of all additions."""
+    P = FE.SIZE
+    results = [None] * len(ps)
+    pending = []
+    nums = []
+    dens = []
+    for i, (p, q) in enumerate(zip(ps, qs)):
+        if p is None:
+            results[i] = q
+            continue
+        if q is None:
+            results[i] = p
+            continue
+        (x1, y1), (x2, y2) = p, q
+        if x1 == x2:
+            if y1 != y2:
+                # A point added to its own negation is infinity.
+                continue
+            # For identical inputs, use the tangent (doubling formula).
+            nums.append(3 * x1 * x1 % P)
+            dens.append(2 * y1 % P)
+        else:
+            # For distinct inputs, use the line through both points (adding formula).
+            nums.append((y2 - y1) % P)
+            dens.append((x2 - x1) % P)
+        pending.append((i, x1, y1, x2))
+    for (i, x1, y1, x2), num, den_inv in zip(pending, nums, _batch_inverse(dens, P)):
+        lam = num * den_inv % P
+        x3 = (lam * lam - x1 - x2) % P
+        results[i] = (x3, (lam * (x1 - x3) - y1) % P)
+    return results
+
+
 # TODO Docstrings of methods still say "field element"
 class APrimeFE:
     """Objects of this class represent elements of a prime field.
@@ -108,6 +183,16 @@ class APrimeFE:
             self._den = 1
         return self._num
 
+    @classmethod
+    def batch_normalize(cls, es):
+        """Bring field elements into form den == 1 (as int() does) with a single inversion."""
+        es = [e for e in es if e._den != 1]
+        if not es:
+            return
+        for e, den_inv in zip(es, _batch_inverse([e._den for e in es], cls.SIZE)):
+            e._num = e._num * den_inv % cls.SIZE
+            e._den = 1
+
     def sqrt(self):
         """Compute the square root of a field element if it exists (None otherwise)."""
         raise NotImplementedError
@@ -148,7 +233,197 @@ class APrimeFE:
         return f"{type(self).__qualname__}(0x{int(self):x})"
 
 
-class FE(APrimeFE):
+def _jacobi(a, n):
+    """Compute the Jacobi symbol (a/n) for an odd positive integer n."""
+    a %= n
+    t = 1
+    while a != 0:
+        # Remove factors of two, using (2/n) = -1 iff n = 3, 5 (mod 8).
+        while a & 1 == 0:
+            a >>= 1
+            if n & 7 in (3, 5):
+                t = -t
+        # Quadratic reciprocity: (a/n) = -(n/a) iff a = n = 3 (mod 4).
+        a, n = n, a
+        if a & 3 == 3 and n & 3 == 3:
+            t = -t
+        a %= n
+    return t if n == 1 else 0
+
+
+class APrimeIntFE:
+    """Objects of this class represent elements of a prime field.
+
+    This is a faster alternative to APrimeFE with the same interface. Elements are represented
+    internally by an integer in range 0..SIZE-1 and a denominator, which is 1 unless the element
+    results from a division. Operations on elements with denominator 1 are thus plain integer
+    operations followed by a reduction. Divisions do not invert eagerly: as in APrimeFE, the
+    denominator is carried along until the element is converted to an integer.
+    """
+
+    __slots__ = ('_v', '_den')
+
+    # The size of the field (also its modulus and characteristic).
+    SIZE: int
+
+    def __init__(self, a=0, b=1):
+        """Initialize a field element a/b; both a and b can be ints or field elements."""
+        if isinstance(a, type(self)):
+            v, den = a._v, a._den
+        else:
+            v, den = a % self.SIZE, 1
+        if isinstance(b, type(self)):
+            v, den = v * b._den % self.SIZE, den * b._v % self.SIZE
+        elif b != 1:
+            den = den * b % self.SIZE
+        assert den != 0
+        self._v = v
+        self._den = den
+
+    @classmethod
+    def _from_int(cls, v, den=1):
+        """Construct a field element v/den from integers already reduced modulo SIZE."""
+        r = object.__new__(cls)
+        r._v = v
+        r._den = den
+        return r
+
+    def __add__(self, a):
+        """Compute the sum of two field elements (second may be int)."""
+        if isinstance(a, type(self)):
+            if self._den == a._den:
+                return self._from_int((self._v + a._v) % self.SIZE, self._den)
+            return self._from_int((self._v * a._den + a._v * self._den) % self.SIZE,
+                                  self._den * a._den % self.SIZE)
+        if isinstance(a, int):
+            return self._from_int((self._v + a * self._den) % self.SIZE, self._den)
+        return NotImplemented
+
+    def __radd__(self, a):
+        """Compute the sum of an integer and a field element."""
+        return self + a
+
+    @classmethod
+    def sum(cls, *es):
+        """Compute the sum of field elements.
+
+        sum(a, b, c, ...) is identical to (0 + a + b + c + ...)."""
+        if all(e._den == 1 for e in es):
+            return cls._from_int(sum(e._v for e in es) % cls.SIZE)
+        return sum(es, start=cls(0))
+
+    def __sub__(self, a):
+        """Compute the difference of two field elements (second may be int)."""
+        if isinstance(a, type(self)):
+            if self._den == a._den:
+                return self._from_int((self._v - a._v) % self.SIZE, self._den)
+            return self._from_int((self._v * a._den - a._v * self._den) % self.SIZE,
+                                  self._den * a._den % self.SIZE)
+        if isinstance(a, int):
+            return self._from_int((self._v - a * self._den) % self.SIZE, self._den)
+        return NotImplemented
+
+    def __rsub__(self, a):
+        """Compute the difference of an integer and a field element."""
+        return self._from_int((a * self._den - self._v) % self.SIZE, self._den)
+
+    def __mul__(self, a):
+        """Compute the product of two field elements (second may be int)."""
+        if isinstance(a, type(self)):
+            if self._den == 1 and a._den == 1:
+                return self._from_int(self._v * a._v % self.SIZE)
+            return self._from_int(self._v * a._v % self.SIZE, self._den * a._den % self.SIZE)
+        if isinstance(a, int):
+            return self._from_int(self._v * a % self.SIZE, self._den)
+        return NotImplemented
+
+    def __rmul__(self, a):
+        """Compute the product of an integer with a field element."""
+        return self * a
+
+    def __truediv__(self, a):
+        """Compute the ratio of two field elements (second may be int)."""
+        if isinstance(a, type(self)) or isinstance(a, int):
+            return type(self)(self, a)
+        return NotImplemented
+
+    def __pow__(self, a):
+        """Raise a field element to an integer power."""
+        return self._from_int(pow(self._v, a, self.SIZE), pow(self._den, a, self.SIZE))
+
+    def __neg__(self):
+        """Negate a field element."""
+        return self._from_int(-self._v % self.SIZE, self._den)
+
+    def __int__(self):
+        """Convert a field element to an integer in range 0..SIZE-1. The result is cached."""
+        if self._den != 1:
+            self._v = self._v * pow(self._den, -1, self.SIZE) % self.SIZE
+            self._den = 1
+        return self._v
+
+    @classmethod
+    def batch_normalize(cls, es):
+        """Bring field elements into form den == 1 (as int() does) with a single inversion."""
+        es = [e for e in es if e._den != 1]
+        if not es:
+            return
+        for e, den_inv in zip(es, _batch_inverse([e._den for e in es], cls.SIZE)):
+            e._v = e._v * den_inv % cls.SIZE
+            e._den = 1
+
+    def sqrt(self):
+        """Compute the square root of a field element if it exists (None otherwise)."""
+        raise NotImplementedError
+
+    def is_square(self):
+        """Determine if this field element has a square root."""
+        # v/den is a square iff v*den = (v/den) * den^2 is.
+        return _jacobi(self._v * self._den, self.SIZE) >= 0
+
+    def is_even(self):
+        """Determine whether this field element, represented as integer in 0..SIZE-1, is even."""
+        return int(self) & 1 == 0
+
+    def __eq__(self, a):
+        """Check whether two field elements are equal (second may be an int)."""
+        if isinstance(a, type(self)):
+            if self._den == a._den:
+                return self._v == a._v
+            return (self._v * a._den - a._v * self._den) % self.SIZE == 0
+        return (self._v - a * self._den) % self.SIZE == 0
+
+    def to_bytes(self):
+        """Convert a field element to a 32-byte array (BE byte order)."""
+        return int(self).to_bytes(32, 'big')
+
+    @classmethod
+    def from_bytes(cls, b):
+        """Convert a 32-byte array to a field element (BE byte order, no overflow allowed)."""
+        v = int.from_bytes(b, 'big')
+        if v >= cls.SIZE:
+            return None
+        return cls._from_int(v)
+
+    def __str__(self):
+        """Convert this field element to a 64 character hex string."""
+        return f"{int(self):064x}"
+
+    def __repr__(self):
+        """Get a string representation of this field element."""
+        return f"{type(self).__qualname__}(0x{int(self):x})"
+
+
+# The implementation of prime field elements that FE and Scalar are based on.
+FIELD_IMPL = os.environ.get("SECP256K1REF_FIELD", "fraction")
+if FIELD_IMPL not in ("fraction", "int"):
+    raise ValueError(f"SECP256K1REF_FIELD must be \"fraction\" or \"int\", not {FIELD_IMPL!r}")
+_APrimeFEImpl = APrimeIntFE if FIELD_IMPL == "int" else APrimeFE
+
+
+class FE(_APrimeFEImpl):  # type: ignore[valid-type, misc]
+    __slots__ = ()
+
     SIZE = 2**256 - 2**32 - 977
 
     def sqrt(self):
@@ -163,14 +438,37 @@ class FE(APrimeFE):
         # to x^2 = a^(1 + (p-1)/2) mod p. As (1 + (p-1)/2) is even, this is equivalent to
         # x = a^((1 + (p-1)/2)/2) mod p, or x = a^((p+1)/4) mod p."""
         v = int(self)
-        s = pow(v, (self.SIZE + 1) // 4, self.SIZE)
-        if s**2 % self.SIZE == v:
+        P = self.SIZE
+
+        # The exponent (p+1)/4 is computed with the addition chain used by libsecp256k1, whose
+        # binary representation is made of blocks of 1s of lengths {2, 22, 223}.
+        # Variable xN holds v^(2^N - 1); pow(x, 2^k, P) squares x k times.
+        def sqr_mul(x, k, y):
+            return pow(x, 1 << k, P) * y % P
+
+        x2 = sqr_mul(v, 1, v)
+        x3 = sqr_mul(x2, 1, v)
+        x6 = sqr_mul(x3, 3, x3)
+        x9 = sqr_mul(x6, 3, x3)
+        x11 = sqr_mul(x9, 2, x2)
+        x22 = sqr_mul(x11, 11, x11)
+        x44 = sqr_mul(x22, 22, x22)
+        x88 = sqr_mul(x44, 44, x44)
+        x176 = sqr_mul(x88, 88, x88)
+        x220 = sqr_mul(x176, 44, x44)
+        x223 = sqr_mul(x220, 3, x3)
+        t = sqr_mul(x223, 23, x22)
+        t = sqr_mul(t, 6, x2)
+        s = pow(t, 4, P)
+        if s * s % P == v:
             return type(self)(s)
         return None
 
 
-class Scalar(APrimeFE):
+class Scalar(_APrimeFEImpl):  # type: ignore[valid-type, misc]
     """TODO Docstring"""
+    __slots__ = ()
+
     SIZE = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
 
 
@@ -186,6 +484,9 @@ class GE:
 
     The point at infinity has field:
     * infinity: True
+
+    The normalized coordinates and the compressed encoding of a point are computed lazily and
+    cached, so that comparing, hashing and serializing the same point again is cheap.
     """
 
     # TODO The following two class attributes should probably be just getters as
@@ -229,6 +530,28 @@ class GE:
             self._infinity = False
             self._x = fx
             self._y = fy
+        self._coords = None
+        self._compressed = None
+
+    @staticmethod
+    def _unchecked(x, y):
+        """Initialize a group element with coordinates known to satisfy the curve equation.
+
+        This is meant for points computed by group operations from valid points, and skips the
+        (relatively expensive) check done by GE(x, y)."""
+        r = GE.__new__(GE)
+        r._infinity = False
+        r._x = x if isinstance(x, FE) else FE(x)
+        r._y = y if isinstance(y, FE) else FE(y)
+        r._coords = None
+        r._compressed = None
+        return r
+
+    def _xy(self):
+        """Return the normalized coordinates of a non-infinite group element as integers."""
+        if self._coords is None:
+            self._coords = (int(self._x), int(self._y))
+        return self._coords
 
     def __add__(self, a):
         """Add two group elements together."""
@@ -251,14 +574,73 @@ class GE:
         # Determine point opposite to the intersection of that line with the curve.
         x = lam**2 - (self.x + a.x)
         y = lam * (self.x - x) - self.y
-        return GE(x, y)
+        return GE._unchecked(x, y)
 
     @staticmethod
     def sum(*ps):
         """Compute the sum of group elements.
 
         GE.sum(a, b, c, ...) is identical to (GE() + a + b + c + ...)."""
-        return sum(ps, start=GE())
+        if not backend.is_fast():
+            return sum(ps, start=GE())
+        r = _GEJ()
+        for p in ps:
+            r = r.add_mixed(p)
+        return r.to_ge()
+
+    @staticmethod
+    def batch_sum(*columns):
+        """Compute the sums of many sequences of group elements.
+
+        GE.batch_sum(c1, c2, ...) is identical to [GE.sum(*c1), GE.sum(*c2), ...]. With the
+        fast backend, all sequences are summed in a tree of pairwise additions, and all additions
+        on the same level of the trees share a single inversion (see _affine_batch_add)."""
+        if not backend.is_fast():
+            return [GE.sum(*column) for column in columns]
+        levels = [[None if p.infinity else p._xy() for p in column] for column in columns]
+        while any(len(level) > 1 for level in levels):
+            ps = []
+            qs = []
+            for level in levels:
+                ps += level[0:len(level) - 1:2]
+                qs += level[1::2]
+            sums = iter(_affine_batch_add(ps, qs))
+            levels = [[next(sums) for _ in range(len(level) // 2)] + level[len(level) - len(level) % 2:]
+                      for level in levels]
+        return [GE() if not level or level[0] is None else GE._unchecked(*level[0]) for level in levels]
+
+    @staticmethod
+    def batch_add(ps, qs):
+        """Compute the element-wise sums [ps[0] + qs[0], ps[1] + qs[1], ...].
+
+        With the fast backend, the slopes of all additions are computed with a single inversion
+        (see _batch_inverse), so each addition costs only a few multiplications."""
+        assert len(ps) == len(qs)
+        if not backend.is_fast():
+            return [p + q for p, q in zip(ps, qs)]
+        sums = _affine_batch_add([None if p.infinity else p._xy() for p in ps],
+                                 [None if q.infinity else q._xy() for q in qs])
+        return [GE() if s is None else GE._unchecked(*s) for s in sums]
+
+    @staticmethod
+    def eval_poly(ps, x):
+        """Compute ps[0] + x*ps[1] + x^2*ps[2] + ... for a small non-negative integer x.
+
+        With the fast backend, this uses Horner's method, which needs only about log2(x)
+        doublings and additions per point instead of multiplications by 256-bit scalars."""
+        assert x >= 0
+        if not backend.is_fast():
+            return GE.batch_mul(*((x**j, p) for j, p in enumerate(ps)))
+        r = _GEJ()
+        for p in reversed(ps):
+            # r = x*r + p, computing x*r by double-and-add
+            acc = _GEJ()
+            for bit in bin(x)[2:]:
+                acc = acc.double()
+                if bit == '1':
+                    acc = acc.add(r)
+            r = acc.add_mixed(p)
+        return r.to_ge()
 
     @staticmethod
     def batch_mul(*aps):
@@ -266,8 +648,36 @@ class GE:
 
         GE.batch_mul((a1, p1), (a2, p2), (a3, p3)) is identical to a1*p1 + a2*p2 + a3*p3,
         but more efficient."""
-        # Reduce all the scalars modulo order first (so we can deal with negatives etc).
-        naps = [(int(a), p) for a, p in aps]
+        # Reduce all the scalars modulo order first (so we can deal with negatives etc), and
+        # drop the terms which do not contribute to the result.
+        naps = [(int(Scalar(a)), p) for a, p in aps]
+        if not backend.is_fast():
+            return GE._batch_mul_reference(naps)
+        naps = [(a, p) for a, p in naps if a != 0 and not p.infinity]
+        # Strauss' algorithm is faster for few terms, Pippenger's algorithm for many terms.
+        if len(naps) < PIPPENGER_THRESHOLD:
+            return _ecmult_strauss(naps).to_ge()
+        return _ecmult_pippenger(naps).to_ge()
+
+    @staticmethod
+    def batch_mul_fixed_scalar(a, ps):
+        """Multiply many group elements by the same scalar.
+
+        GE.batch_mul_fixed_scalar(a, [p1, p2, ...]) is identical to [a*p1, a*p2, ...], but
+        more efficient: the scalar is recoded only once, and all results are converted to
+        affine coordinates with a single inversion."""
+        a = int(Scalar(a))
+        if not backend.is_fast():
+            return [GE._batch_mul_reference([(a, p)]) for p in ps]
+        if a == 0:
+            return [GE() for _ in ps]
+        finite = [p for p in ps if not p.infinity]
+        results = iter(_ecmult_fixed_scalar(a, finite))
+        return [GE() if p.infinity else GE._unchecked(*next(results)) for p in ps]
+
+    @staticmethod
+    def _batch_mul_reference(naps):
+        """Compute sum(a*p for (a, p) in naps) using double-and-add, for 0 <= a < ORDER."""
         # Start with point at infinity.
         r = GE()
         # Iterate over all bit positions, from high to low.
@@ -283,14 +693,16 @@ class GE:
     def __rmul__(self, a):
         """Multiply an integer with a group element."""
         if self == G:
-            return FAST_G.mul(Scalar(a))
+            if backend.is_fast():
+                return FAST_G.mul(Scalar(a))
+            return FAST_G.mul_reference(Scalar(a))
         return GE.batch_mul((Scalar(a), self))
 
     def __neg__(self):
         """Compute the negation of a group element."""
         if self.infinity:
             return self
-        return GE(self.x, -self.y)
+        return GE._unchecked(self.x, -self.y)
 
     def __sub__(self, a):
         """Subtract a group element from another."""
@@ -298,7 +710,11 @@ class GE:
 
     def __eq__(self, a):
         """Check if two group elements are equal."""
-        return (self - a).infinity
+        if not isinstance(a, GE):
+            return NotImplemented
+        if self.infinity or a.infinity:
+            return self.infinity and a.infinity
+        return self._xy() == a._xy()
 
     def has_even_y(self):
         """Determine whether a non-infinity group element has an even y coordinate."""
@@ -308,7 +724,10 @@ class GE:
     def to_bytes_compressed(self):
         """Convert a non-infinite group element to 33-byte compressed encoding."""
         assert not self.infinity
-        return bytes([3 - self.y.is_even()]) + self.x.to_bytes()
+        if self._compressed is None:
+            x, y = self._xy()
+            self._compressed = bytes([2 + (y & 1)]) + x.to_bytes(32, 'big')
+        return self._compressed
 
     def to_bytes_compressed_with_infinity(self):
         """Convert a group element to 33-byte compressed encoding, mapping infinity to zeros."""
@@ -316,6 +735,25 @@ class GE:
             return 33 * b"\x00"
         return self.to_bytes_compressed()
 
+    @staticmethod
+    def batch_normalize(ps):
+        """Normalize the coordinates of many group elements with a single inversion.
+
+        Serializing, comparing or hashing a group element requires its coordinates in normalized
+        form, which costs one inversion per point if done one at a time."""
+        coords = []
+        for p in ps:
+            if not p.infinity:
+                coords += [p.x, p.y]
+        FE.batch_normalize(coords)
+
+    @staticmethod
+    def batch_to_bytes_compressed_with_infinity(ps):
+        """Convert a list of group elements to the concatenation of their 33-byte compressed
+        encodings (mapping infinity to zeros), normalizing them with a single inversion."""
+        GE.batch_normalize(ps)
+        return b"".join(p.to_bytes_compressed_with_infinity() for p in ps)
+
     def to_bytes_uncompressed(self):
         """Convert a non-infinite group element to 65-byte uncompressed encoding."""
         assert not self.infinity
@@ -324,7 +762,7 @@ class GE:
     def to_bytes_xonly(self):
         """Convert (the x coordinate of) a non-infinite group element to 32-byte xonly encoding."""
         assert not self.infinity
-        return self.x.to_bytes()
+        return self.to_bytes_compressed()[1:]
 
     @staticmethod
     def lift_x(x):
@@ -334,12 +772,18 @@ class GE:
             return None
         if not y.is_even():
             y = -y
-        return GE(x, y)
+        return GE._unchecked(x, y)
 
     @staticmethod
     def from_bytes_compressed(b):
         """Convert a compressed to a group element."""
         assert len(b) == 33
+        if backend.is_fast():
+            return DECODE_CACHE.get_or_compute(bytes(b), lambda: GE._from_bytes_compressed(b))
+        return GE._from_bytes_compressed(b)
+
+    @staticmethod
+    def _from_bytes_compressed(b):
         if b[0] != 2 and b[0] != 3:
             return None
         x = FE.from_bytes(b[1:])
@@ -362,7 +806,7 @@ class GE:
         y = FE.from_bytes(b[33:])
         if y**2 != x**3 + 7:
             return None
-        return GE(x, y)
+        return GE._unchecked(x, y)
 
     @staticmethod
     def from_bytes(b):
@@ -377,6 +821,12 @@ class GE:
     def from_bytes_xonly(b):
         """Convert a point given in xonly encoding to a group element."""
         assert len(b) == 32
+        if backend.is_fast():
+            return DECODE_CACHE.get_or_compute(bytes(b), lambda: GE._from_bytes_xonly(b))
+        return GE._from_bytes_xonly(b)
+
+    @staticmethod
+    def _from_bytes_xonly(b):
         x = FE.from_bytes(b)
         if x is None:
             return None
@@ -403,38 +853,513 @@ class GE:
         """Compute a non-cryptographic hash of the group element."""
         if self.infinity:
             return 0  # 0 is not a valid x coordinate
-        return int(self.x)
+        return self._xy()[0]
+
+
+# Cache of decoded group elements (or None for invalid encodings), keyed by their compressed or
+# xonly encoding. Decoding requires a square root, and the same public keys are typically decoded
+# over and over again. Used by GE.from_bytes_compressed and GE.from_bytes_xonly with the fast
+# backend; DECODE_CACHE.stats() reports hits and misses.
+DECODE_CACHE = LRUCache(4096)
+
+
+class _GEJ:
+    """Internal representation of a group element in Jacobian coordinates.
+
+    A triple (X, Y, Z) with Z != 0 represents the affine point (X/Z^2, Y/Z^3), and Z == 0
+    represents the point at infinity. The coordinates are plain integers modulo FE.SIZE, so
+    that no inversions, fraction reductions or curve checks take place during the additions and
+    doublings of a scalar multiplication. Conversion to an affine GE (which costs a single
+    inversion) only happens at the end, via to_ge().
+    """
+
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x=0, y=1, z=0):
+        """Initialize a Jacobian group element; the default is the point at infinity."""
+        self.x = x
+        self.y = y
+        self.z = z
+
+    @staticmethod
+    def from_ge(p):
+        """Convert an affine group element to Jacobian coordinates."""
+        if p.infinity:
+            return _GEJ()
+        return _GEJ(int(p.x), int(p.y), 1)
+
+    @property
+    def infinity(self):
+        """Whether the group element is the point at infinity."""
+        return self.z == 0
+
+    def double(self):
+        """Compute 2*self (formula dbl-2009-l for curves with a = 0)."""
+        P = FE.SIZE
+        if self.z == 0 or self.y == 0:
+            return _GEJ()
+        a = self.x * self.x % P
+        b = self.y * self.y % P
+        c = b * b % P
+        d = 2 * ((self.x + b) ** 2 - a - c) % P
+        e = 3 * a
+        f = e * e % P
+        x3 = (f - 2 * d) % P
+        y3 = (e * (d - x3) - 8 * c) % P
+        z3 = 2 * self.y * self.z % P
+        return _GEJ(x3, y3, z3)
+
+    def add_mixed(self, p):
+        """Compute self + p for an affine group element p."""
+        if p.infinity:
+            return self
+        return self.add_affine(int(p.x), int(p.y))
+
+    def add_affine(self, x2, y2):
+        """Compute self + (x2, y2) for affine integer coordinates (formula madd-2004-hmv)."""
+        if self.z == 0:
+            return _GEJ(x2, y2, 1)
+        P = FE.SIZE
+        z1z1 = self.z * self.z % P
+        u2 = x2 * z1z1 % P
+        s2 = y2 * self.z * z1z1 % P
+        h = (u2 - self.x) % P
+        r = (s2 - self.y) % P
+        if h == 0:
+            # Both points have the same affine x coordinate.
+            if r == 0:
+                return self.double()
+            return _GEJ()
+        hh = h * h % P
+        hhh = h * hh % P
+        v = self.x * hh % P
+        x3 = (r * r - hhh - 2 * v) % P
+        y3 = (r * (v - x3) - self.y * hhh) % P
+        z3 = self.z * h % P
+        return _GEJ(x3, y3, z3)
+
+    def add(self, a):
+        """Compute self + a for another Jacobian group element a (formula add-1998-cmo-2)."""
+        if a.z == 0:
+            return self
+        if self.z == 0:
+            return a
+        P = FE.SIZE
+        z1z1 = self.z * self.z % P
+        z2z2 = a.z * a.z % P
+        u1 = self.x * z2z2 % P
+        u2 = a.x * z1z1 % P
+        s1 = self.y * a.z * z2z2 % P
+        s2 = a.y * self.z * z1z1 % P
+        h = (u2 - u1) % P
+        r = (s2 - s1) % P
+        if h == 0:
+            if r == 0:
+                return self.double()
+            return _GEJ()
+        hh = h * h % P
+        hhh = h * hh % P
+        v = u1 * hh % P
+        x3 = (r * r - hhh - 2 * v) % P
+        y3 = (r * (v - x3) - s1 * hhh) % P
+        z3 = self.z * a.z * h % P
+        return _GEJ(x3, y3, z3)
+
+    def __neg__(self):
+        """Compute the negation of a Jacobian group element."""
+        return _GEJ(self.x, -self.y % FE.SIZE, self.z)
+
+    def to_ge(self):
+        """Convert to an affine group element (requires one inversion)."""
+        return _GEJ.batch_to_ge([self])[0]
+
+    @staticmethod
+    def batch_to_affine(ps):
+        """Convert non-infinite Jacobian group elements to affine (x, y) integer pairs.
+
+        This requires a single inversion in total, see _batch_inverse."""
+        P = FE.SIZE
+        affine = []
+        for p, zinv in zip(ps, _batch_inverse([p.z for p in ps], P)):
+            zinv2 = zinv * zinv % P
+            affine.append((p.x * zinv2 % P, p.y * zinv2 * zinv % P))
+        return affine
+
+    @staticmethod
+    def batch_to_ge(ps):
+        """Convert Jacobian group elements to affine group elements with a single inversion."""
+        finite = [p for p in ps if not p.infinity]
+        affine = iter(_GEJ.batch_to_affine(finite))
+        return [GE() if p.infinity else GE._unchecked(*next(affine)) for p in ps]
+
+
+# Number of terms from which on GE.batch_mul uses Pippenger's algorithm instead of Strauss'.
+PIPPENGER_THRESHOLD = 128
+
+# Window size of the wNAF representation used by Strauss' algorithm. The precomputed table for
+# each term holds 2^(STRAUSS_WINDOW-2) odd multiples of its point.
+STRAUSS_WINDOW = 5
+
+
+# The curve has an efficiently computable endomorphism: lambda*(x, y) == (beta*x, y) for every
+# point (x, y), where lambda is a cube root of unity modulo the group order and beta is a cube
+# root of unity modulo the field size.
+_LAMBDA = 0x5363AD4CC05C30E0A5261C028812645A122E22EA20816678DF02967C1B23BD72
+_BETA = 0x7AE96A2B657C07106E64479EAC3434E99CF0497512F58995C1396C28719501EE
+
+# A short basis {(a1, b1), (a2, b2)} of the lattice of pairs (x, y) with x + y*lambda == 0
+# (mod order), as given in "Guide to Elliptic Curve Cryptography" by Hankerson, Menezes and
+# Vanstone, Section 3.5.
+_A1 = 0x3086D221A7D46BCDE86C90E49284EB15
+_B1 = -0xE4437ED6010E88286F547FA90ABFE4C3
+_A2 = 0x114CA50F7A8E2F3F657C1108D9D44CFD8
+_B2 = 0x3086D221A7D46BCDE86C90E49284EB15
+
+
+def _split_lambda(k):
+    """Split a scalar k into (k1, k2) such that k1 + k2*lambda == k (mod order).
+
+    k1 and k2 may be negative, but their absolute values are at most 2^128. Computing
+    k1*p + k2*(lambda*p) thus only requires half as many doublings as computing k*p."""
+    n = GE.ORDER
+    # Round k to the closest lattice vector and return the (short) difference.
+    c1 = (_B2 * k + n // 2) // n
+    c2 = (-_B1 * k + n // 2) // n
+    k1 = k - c1 * _A1 - c2 * _A2
+    k2 = -c1 * _B1 - c2 * _B2
+    return k1, k2
+
+
+def _wnaf(a, w):
+    """Compute the width-w non-adjacent form of a non-negative integer a.
+
+    The result is a list of digits d[i], least significant first, such that
+    a == sum(d[i] * 2^i). Every non-zero digit is odd with |d[i]| < 2^(w-1), and any w
+    consecutive digits contain at most one non-zero digit."""
+    digits = []
+    while a:
+        if a & 1:
+            d = a & ((1 << w) - 1)
+            if d >= 1 << (w - 1):
+                d -= 1 << w
+            a -= d
+        else:
+            d = 0
+        digits.append(d)
+        a >>= 1
+    return digits
+
+
+def _odd_multiples(p, count):
+    """Compute [1*p, 3*p, 5*p, ..., (2*count-1)*p] in Jacobian coordinates."""
+    pj = _GEJ.from_ge(p)
+    p2 = pj.double()
+    table = [pj]
+    for _ in range(count - 1):
+        table.append(table[-1].add(p2))
+    return table
+
+
+def _ecmult_strauss(naps):
+    """Compute sum(a*p for (a, p) in naps) using Strauss' algorithm with wNAF and GLV.
+
+    Every scalar is split into two halves of about 128 bits (see _split_lambda), so every term
+    contributes two wNAF-recoded scalars: one for p, and one for lambda*p, whose odd multiples
+    are obtained from those of p by applying the endomorphism. All of them share the same
+    sequence of about 128 doublings, and every one only contributes an addition for each of its
+    non-zero wNAF digits (about one in STRAUSS_WINDOW + 1 bits). The tables of odd multiples of
+    all terms are converted to affine coordinates together, so that these additions are mixed
+    additions."""
+    count = 1 << (STRAUSS_WINDOW - 2)
+    multiples = []
+    for _, p in naps:
+        multiples += _odd_multiples(p, count)
+    affine = _GEJ.batch_to_affine(multiples)
+    P = FE.SIZE
+    wnafs = []
+    tables = []
+    for i, (a, _) in enumerate(naps):
+        table = affine[i * count : (i + 1) * count]
+        table_lambda = [(_BETA * x % P, y) for x, y in table]
+        for k, t in zip(_split_lambda(a), (table, table_lambda)):
+            wnaf = _wnaf(abs(k), STRAUSS_WINDOW)
+            wnafs.append(wnaf if k >= 0 else [-d for d in wnaf])
+            tables.append(t)
+    r = _GEJ()
+    for i in range(max(map(len, wnafs), default=0) - 1, -1, -1):
+        r = r.double()
+        for wnaf, table in zip(wnafs, tables):
+            if i < len(wnaf) and wnaf[i]:
+                d = wnaf[i]
+                if d > 0:
+                    x, y = table[d >> 1]
+                    r = r.add_affine(x, y)
+                else:
+                    x, y = table[(-d) >> 1]
+                    r = r.add_affine(x, P - y)
+    return r
+
+
+def _ecmult_fixed_scalar(a, ps):
+    """Compute [a*p for p in ps] as affine (x, y) pairs (or None for infinity), for a non-zero
+    scalar a and non-infinite points ps.
+
+    This is the wNAF/GLV method of _ecmult_strauss for a single term, but the scalar a is split
+    and recoded only once. Since the sequence of doublings and additions then is the same for all
+    points, every step is carried out for all points at once in affine coordinates, with a single
+    inversion per step (see _affine_batch_add)."""
+    count = 1 << (STRAUSS_WINDOW - 2)
+    wnafs = []
+    for k in _split_lambda(a):
+        wnaf = _wnaf(abs(k), STRAUSS_WINDOW)
+        wnafs.append(wnaf if k >= 0 else [-d for d in wnaf])
+    multiples = []
+    for p in ps:
+        multiples += _odd_multiples(p, count)
+    affine = _GEJ.batch_to_affine(multiples)
+    P = FE.SIZE
+    # tables[0][d >> 1][j] = d*ps[j] and tables[1][d >> 1][j] = d*lambda*ps[j] for odd d > 0
+    tables = ([affine[m::count] for m in range(count)], [])
+    tables[1].extend([(_BETA * x % P, y) for x, y in column] for column in tables[0])
+    rs = [None] * len(ps)
+    for i in range(max(map(len, wnafs)) - 1, -1, -1):
+        if any(r is not None for r in rs):
+            rs = _affine_batch_add(rs, rs)
+        for wnaf, table in zip(wnafs, tables):
+            if i < len(wnaf) and wnaf[i]:
+                d = wnaf[i]
+                if d > 0:
+                    rs = _affine_batch_add(rs, table[d >> 1])
+                else:
+                    rs = _affine_batch_add(rs, [(x, P - y) for x, y in table[(-d) >> 1]])
+    return rs
+
+
+def _pippenger_window(n):
+    """Return the bucket window size used by Pippenger's algorithm for n terms."""
+    # Thresholds as used by libsecp256k1's ecmult_multi_var.
+    for window, max_n in ((1, 1), (2, 4), (3, 20), (4, 57), (5, 136), (6, 235), (7, 1260),
+                          (9, 4420), (10, 7880), (11, 16050)):
+        if n <= max_n:
+            return window
+    return 12
+
+
+def _ecmult_pippenger(naps):
+    """Compute sum(a*p for (a, p) in naps) using Pippenger's bucket algorithm with GLV.
+
+    Every scalar is split into two halves of about 128 bits (see _split_lambda), which halves
+    the number of windows. See _ecmult_pippenger_nosplit."""
+    split = []
+    for a, p in naps:
+        k1, k2 = _split_lambda(a)
+        lp = GE._unchecked(_BETA * int(p.x), p.y)
+        split.append((k1, p) if k1 >= 0 else (-k1, -p))
+        split.append((k2, lp) if k2 >= 0 else (-k2, -lp))
+    return _ecmult_pippenger_nosplit([(a, p) for a, p in split if a != 0])
+
+
+def _ecmult_pippenger_nosplit(naps):
+    """Compute sum(a*p for (a, p) in naps) using Pippenger's bucket algorithm.
+
+    The scalars are split into windows of c bits. For each window, every point is added into
+    the bucket selected by its c-bit digit, and the buckets are then combined with a running sum
+    so that bucket b is counted b times. This costs about n + 2^(c+1) additions per window,
+    instead of n additions per non-zero digit."""
+    c = _pippenger_window(len(naps))
+    nbits = max(a.bit_length() for a, _ in naps)
+    mask = (1 << c) - 1
+    r = _GEJ()
+    for shift in range(((nbits - 1) // c) * c, -1, -c):
+        for _ in range(c):
+            r = r.double()
+        buckets = [_GEJ() for _ in range(mask)]
+        for a, p in naps:
+            digit = (a >> shift) & mask
+            if digit:
+                buckets[digit - 1] = buckets[digit - 1].add_mixed(p)
+        # Compute sum(b * buckets[b-1]) as the sum of all suffix sums of the buckets.
+        running = _GEJ()
+        window_sum = _GEJ()
+        for bucket in reversed(buckets):
+            running = running.add(bucket)
+            window_sum = window_sum.add(running)
+        r = r.add(window_sum)
+    return r
 
 
 # The secp256k1 generator point
 G = GE.lift_x(0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798)
 
 
+class _MappedTable:
+    """Read-only sequence of affine (x, y) integer pairs, backed by a memory-mapped file.
+
+    Entries are decoded on access, so that all processes mapping the same file share one copy
+    of the table in memory."""
+
+    def __init__(self, buf, count):
+        self.buf = buf
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        assert 0 <= i < self.count
+        start = 64 * i
+        return (int.from_bytes(self.buf[start:start + 32], 'big'),
+                int.from_bytes(self.buf[start + 32:start + 64], 'big'))
+
+
 class FastGEMul:
     """Table for fast multiplication with a constant group element.
 
-    Speed up scalar multiplication with a fixed point P by using a precomputed lookup table with
-    its powers of 2:
+    Speed up scalar multiplication with a fixed point P by using a precomputed lookup table.
+    The scalar is split into windows of w bits, and for each window position i the table holds
+    all non-zero multiples of (2^(w*i))*P that a w-bit digit can select:
 
-        table = [P, 2*P, 4*P, (2^3)*P, (2^4)*P, ..., (2^255)*P]
+        table[i*(2^w - 1) + (d - 1)] = d * (2^(w*i)) * P    for d = 1..2^w-1
 
-    During multiplication, the points corresponding to each bit set in the scalar are added up,
-    i.e. on average ~128 point additions take place.
+    During multiplication, one table entry is added per non-zero digit, i.e. at most
+    ceil(256/w) point additions and no doublings take place (32 for w=8). The table holds
+    ceil(256/w) * (2^w - 1) points, so larger windows trade memory and setup time for speed.
+
+    The table is computed on first use. It can be stored in a file with save() and mapped into
+    memory again with load(), see also SECP256K1REF_TABLE_DIR. Files must be trusted, see the
+    module docstring.
     """
 
-    def __init__(self, p):
-        self.table = [p]  # table[i] = (2^i) * p
-        for _ in range(255):
-            p = p + p
-            self.table.append(p)
+    # Number of random entries compared against recomputed ones when loading a table
+    SPOT_CHECKS = 8
+
+    # File format: MAGIC, then one byte each for FILE_VERSION and the window size, the 33-byte
+    # compressed encoding of P, the 32-byte SHA256 of all entries, and finally all entries as
+    # 64-byte (x, y) pairs.
+    MAGIC = b"SECPTBL\x00"
+    FILE_VERSION = 1
+    HEADER_SIZE = len(MAGIC) + 2 + 33 + 32
+
+    def __init__(self, p, window=6):
+        assert 1 <= window <= 16
+        assert not p.infinity
+        self.p = p
+        self.window = window
+        self.windows = (256 + window - 1) // window
+        self._table = None
+        self._powers = None
 
-    def mul(self, a):
+    @property
+    def table(self):
+        """The precomputed table (built, or loaded from SECP256K1REF_TABLE_DIR, on first use)."""
+        if self._table is None:
+            path = self.default_path()
+            if path is None:
+                self._table = self._build()
+            elif not self.load(path):
+                self._table = self._build()
+                try:
+                    self.save(path)
+                except OSError:
+                    pass
+        return self._table
+
+    def _build(self):
+        """Compute the table."""
+        table = []
+        base = _GEJ.from_ge(self.p)  # base = (2^(w*i)) * p
+        for _ in range(self.windows):
+            multiples = [base]
+            for _ in range((1 << self.window) - 2):
+                multiples.append(multiples[-1].add(base))
+            table += _GEJ.batch_to_affine(multiples)
+            # The next base is 2^w times the current base.
+            base = multiples[-1].add(base)
+        return table
+
+    def _header(self):
+        return self.MAGIC + bytes([self.FILE_VERSION, self.window]) + self.p.to_bytes_compressed()
+
+    def default_path(self):
+        """Return the file name of this table in SECP256K1REF_TABLE_DIR (None if unset)."""
+        directory = os.environ.get("SECP256K1REF_TABLE_DIR")
+        if not directory:
+            return None
+        point = self.p.to_bytes_compressed().hex()
+        return os.path.join(directory, f"fastgemul-v{self.FILE_VERSION}-w{self.window}-{point}.bin")
+
+    def save(self, path):
+        """Write the table to a file (atomically, see write_checksummed)."""
+        entries = b"".join(x.to_bytes(32, 'big') + y.to_bytes(32, 'big') for x, y in self.table)
+        write_checksummed(path, self._header(), entries)
+
+    def load(self, path):
+        """Map the table from a file written by save(), if it is valid for this P and window.
+
+        Return whether the table was loaded. The file is rejected if its version, window size
+        or point differ from this object's, if the checksum of its entries does not match, if
+        any entry is not on the curve, or if any of SPOT_CHECKS random entries (and the first
+        one) differs from its recomputed value."""
+        entries = read_checksummed(path, self._header(), 64, use_mmap=True)
+        count = self.windows * ((1 << self.window) - 1)
+        if entries is None or len(entries) != 64 * count:
+            return False
+        table = _MappedTable(entries, count)
+        if not self._validate(table):
+            return False
+        self._table = table
+        return True
+
+    def _validate(self, table):
+        """Check that all entries are on the curve, and spot-check some against recomputation."""
+        P = FE.SIZE
+        for k in range(len(table)):
+            x, y = table[k]
+            if x >= P or y >= P or (y * y - x * x * x - 7) % P != 0:
+                return False
+        mask = (1 << self.window) - 1
+        # Random indices (with negligible bias), drawn without importing the secrets module,
+        # which would dominate the import time of this module.
+        spot_checks = [int.from_bytes(os.urandom(8), 'big') % len(table)
+                       for _ in range(self.SPOT_CHECKS)]
+        for k in [0] + spot_checks:
+            i, d = divmod(k, mask)
+            expected = GE.batch_mul(((d + 1) << (self.window * i), self.p))
+            if expected.infinity or expected._xy() != table[k]:
+                return False
+        return True
+
+    def mul_reference(self, a):
+        """Compute a*P by adding up (2^i)*P for every bit i set in a, using affine additions.
+
+        This is the simple algorithm used with the reference backend. Its table of the 256
+        powers of two (2^i)*P is computed on first use."""
+        if self._powers is None:
+            p = self.p
+            self._powers = [p]  # _powers[i] = (2^i) * p
+            for _ in range(255):
+                p = p + p
+                self._powers.append(p)
         result = GE()
         a = int(a)
         for bit in range(a.bit_length()):
             if a & (1 << bit):
-                result += self.table[bit]
+                result += self._powers[bit]
         return result
 
-# Precomputed table with multiples of G for fast multiplication
+    def mul(self, a):
+        w = self.window
+        mask = (1 << w) - 1
+        a = int(Scalar(a))
+        table = self.table
+        result = _GEJ()
+        for offset in range(0, self.windows * mask, mask):
+            digit = a & mask
+            if digit:
+                x, y = table[offset + digit - 1]
+                result = result.add_affine(x, y)
+            a >>= w
+        return result.to_ge()
+
+# Precomputed table with multiples of G for fast multiplication (computed on first use)
 FAST_G = FastGEMul(G)
@@ -1,11 +1,47 @@
+from collections import OrderedDict
 import hashlib
+import mmap
+import os
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
+from . import backend
 
-# This implementation can be sped up by storing the midstate after hashing
-# tag_hash instead of rehashing it all the time.
-def tagged_hash(tag: str, msg: bytes) -> bytes:
+# SHA256 midstates after absorbing the 64-byte prefix SHA256(tag) || SHA256(tag), per tag, as
+# used by the fast backend. Copying a midstate is cheaper than hashing the prefix again.
+_TAG_MIDSTATES: Dict[str, Any] = {}
+
+
+def tagged_hasher(tag: str) -> Any:
+    """Return a SHA256 hash object which has absorbed the prefix of tagged hashes with tag.
+
+    The message can then be fed in one or several chunks with update(), without concatenating
+    them first, and digest() returns the tagged hash of their concatenation."""
+    if backend.is_fast():
+        midstate = _TAG_MIDSTATES.get(tag)
+        if midstate is None:
+            tag_hash = hashlib.sha256(tag.encode()).digest()
+            midstate = hashlib.sha256(tag_hash + tag_hash)
+            _TAG_MIDSTATES[tag] = midstate
+        return midstate.copy()
     tag_hash = hashlib.sha256(tag.encode()).digest()
-    return hashlib.sha256(tag_hash + tag_hash + msg).digest()
+    return hashlib.sha256(tag_hash + tag_hash)
+
+
+def tagged_hash(tag: str, msg: bytes) -> bytes:
+    h = tagged_hasher(tag)
+    h.update(msg)
+    return h.digest()
 
 
 def bytes_from_int(x: int) -> bytes:
@@ -22,3 +58,164 @@ def int_from_bytes(b: bytes) -> int:
 
 def hash_sha256(b: bytes) -> bytes:
     return hashlib.sha256(b).digest()
+
+
+def write_checksummed(
+    path: str, header: bytes, entries: Union[bytes, bytearray], mode: int = 0o644
+) -> None:
+    """Write header || SHA256(entries) || entries to a file, for reading with read_checksummed.
+
+    The file is written atomically, by writing to a temporary file first, which is removed again
+    if writing fails. Both files are created with the given permissions (subject to the umask)."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(hashlib.sha256(entries).digest())
+            f.write(entries)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_checksummed(
+    path: str, header: bytes, entry_size: int, use_mmap: bool = False
+) -> Optional[Union[bytes, memoryview]]:
+    """Return the entries of a file written by write_checksummed with the given header.
+
+    Return None if the file cannot be read, if its header differs, if the length of the entries
+    is not a multiple of entry_size, or if their checksum does not match. The checksum only
+    detects corruption, so the file must be trusted. If use_mmap is set, the file is mapped into
+    memory instead of read, and the entries are returned as a memoryview of the mapping."""
+    offset = len(header) + 32
+    try:
+        with open(path, "rb") as f:
+            if use_mmap:
+                buf: Any = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buf = f.read()
+    except (OSError, ValueError):  # mmap raises ValueError for empty files
+        return None
+    if (
+        len(buf) < offset
+        or (len(buf) - offset) % entry_size != 0
+        or buf[: len(header)] != header
+        or hashlib.sha256(buf[offset:]).digest() != buf[len(header) : offset]
+    ):
+        if use_mmap:
+            buf.close()
+        return None
+    return memoryview(buf)[offset:] if use_mmap else buf[offset:]
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+    maxsize: int
+
+
+class LRUCache:
+    """A size-bounded, thread-safe mapping that evicts its least recently used entries."""
+
+    def __init__(
+        self,
+        maxsize: int,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        """Initialize an empty cache.
+
+        If given, on_evict(key, value) is called for every value that leaves the cache, i.e.,
+        that is evicted, replaced or cleared, e.g., to zeroize secret data."""
+        assert maxsize > 0
+        self.maxsize = maxsize
+        self._on_evict = on_evict
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the value cached for key, or compute, cache and return it."""
+        with self._lock:
+            if key in self._entries:
+                self._hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self._misses += 1
+        # Compute without holding the lock. Concurrent misses may compute the same value twice.
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def get(
+        self,
+        key: Hashable,
+        default: Any = None,
+        copy: Optional[Callable[[Any], Any]] = None,
+    ) -> Any:
+        """Return the value cached for key, or default if there is none.
+
+        If given, copy(value) is returned instead of the value. It is called while the lock is
+        held, so that the value cannot be evicted (and passed to on_evict) while copying it."""
+        with self._lock:
+            if key in self._entries:
+                self._hits += 1
+                self._entries.move_to_end(key)
+                value = self._entries[key]
+                return value if copy is None else copy(value)
+            self._misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Cache a value for key, evicting the least recently used entry if necessary."""
+        evicted = []
+        with self._lock:
+            if key in self._entries and self._entries[key] is not value:
+                evicted.append((key, self._entries[key]))
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                evicted.append(self._entries.popitem(last=False))
+        if self._on_evict is not None:
+            for k, v in evicted:
+                self._on_evict(k, v)
+
+    def clear(self) -> None:
+        """Remove all entries and reset the statistics."""
+        with self._lock:
+            evicted = list(self._entries.items())
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+        if self._on_evict is not None:
+            for k, v in evicted:
+                self._on_evict(k, v)
+
+    def keys(self) -> List[Hashable]:
+        """Return all keys, from the least to the most recently used."""
+        with self._lock:
+            return list(self._entries)
+
+    def items(
+        self, copy: Optional[Callable[[Any], Any]] = None
+    ) -> List[Tuple[Any, Any]]:
+        """Return all (key, value) pairs, from the least to the most recently used.
+
+        If given, copy(value) is returned instead of every value, see get()."""
+        with self._lock:
+            if copy is None:
+                return list(self._entries.items())
+            return [(key, copy(value)) for key, value in self._entries.items()]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> CacheStats:
+        """Return the number of hits and misses so far, and the current and maximum size."""
+        with self._lock:
+            return CacheStats(
+                self._hits, self._misses, len(self._entries), self.maxsize
+            )
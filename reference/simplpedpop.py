@@ -1,9 +1,14 @@
-from typing import List, NamedTuple, NewType, Tuple, Optional
+from typing import List, NamedTuple, NewType, Sequence, Tuple, Optional
 
-from secp256k1ref.bip340 import schnorr_sign, schnorr_verify
+from secp256k1ref.bip340 import (
+    schnorr_sign,
+    schnorr_verify,
+    schnorr_batch_find_invalid,
+)
 from secp256k1ref.secp256k1 import GE, Scalar
+from secp256k1ref.scalarvec import ScalarVector
 from util import BIP_TAG, InvalidContributionError
-from vss import VSS, VSSCommitment, VSSVerifyError
+from vss import VSS, VSSCommitment, VSSVerifyError, LazyPubshares
 
 
 ###
@@ -30,6 +35,18 @@ def pop_verify(pop: Pop, pubkey: bytes, idx: int):
     return schnorr_verify(pop_msg(idx), pubkey, pop)
 
 
+def pop_batch_find_invalid(pops: List[Pop], pubkeys: List[GE], idxs: List[int]):
+    """Return the positions in idxs of the invalid pops, verifying all of them at once.
+
+    The pubkeys are taken as (non-infinity) group elements, so they don't need to be decoded."""
+    return schnorr_batch_find_invalid(
+        [pop_msg(idx) for idx in idxs],
+        [P.to_bytes_xonly() for P in pubkeys],
+        pops,
+        points=pubkeys,
+    )
+
+
 ###
 ### Messages
 ###
@@ -50,11 +67,8 @@ class CoordinatorMsg(NamedTuple):
     pops: List[Pop]
 
     def to_bytes(self) -> bytes:
-        return b"".join(
-            [
-                P.to_bytes_compressed_with_infinity()
-                for P in self.coms_to_secrets + self.sum_coms_to_nonconst_terms
-            ]
+        return GE.batch_to_bytes_compressed_with_infinity(
+            self.coms_to_secrets + self.sum_coms_to_nonconst_terms
         ) + b"".join(self.pops)
 
 
@@ -68,7 +82,7 @@ class CoordinatorMsg(NamedTuple):
 class DKGOutput(NamedTuple):
     secshare: Optional[Scalar]  # None for coordinator
     threshold_pubkey: GE
-    pubshares: List[GE]
+    pubshares: Sequence[GE]  # List[GE] or LazyPubshares
 
 
 def assemble_sum_vss_commitment(
@@ -76,22 +90,24 @@ def assemble_sum_vss_commitment(
 ) -> VSSCommitment:
     # Sum the commitments to the secrets
     return VSSCommitment(
-        [GE.sum(*(coms_to_secrets[i] for i in range(n)))] + sum_coms_to_nonconst_terms
+        GE.batch_sum(coms_to_secrets[0:n]) + sum_coms_to_nonconst_terms
     )
 
 
-def common_dkg_output(vss_commit, n: int) -> Tuple[GE, List[GE]]:
+def common_dkg_output(
+    vss_commit, n: int, lazy: bool = False
+) -> Tuple[GE, Sequence[GE]]:
     """Derive the common parts of the DKG output from the sum of all VSS commitments
 
     The common parts are the threshold public key and the individual public shares of
-    all participants."""
+    all participants. If lazy is set, the pubshares are returned as LazyPubshares,
+    which computes them only when accessed."""
     threshold_pubkey = vss_commit.ges[0]
-    signer_pubshares = []
-    for i in range(0, n):
-        pk_i = GE.batch_mul(
-            *(((i + 1) ** j, vss_commit.ges[j]) for j in range(0, vss_commit.t()))
-        )
-        signer_pubshares += [pk_i]
+    signer_pubshares: Sequence[GE]
+    if lazy:
+        signer_pubshares = LazyPubshares(vss_commit, n)
+    else:
+        signer_pubshares = vss_commit.pubshares(n)
     return threshold_pubkey, signer_pubshares
 
 
@@ -114,7 +130,7 @@ class SignerState(NamedTuple):
 
 def signer_step(
     seed: bytes, t: int, n: int, signer_idx: int
-) -> Tuple[SignerState, SignerMsg, List[Scalar]]:
+) -> Tuple[SignerState, SignerMsg, ScalarVector]:
     """
     Generate SimplPedPop messages to be sent to the coordinator.
 
@@ -162,25 +178,32 @@ def signer_pre_finalize(
             None, "Coordinator sent unexpected first group element for local index"
         )
 
-    for i in range(n):
-        if i == idx:
-            # No need to check our own pop.
-            continue
-        if coms_to_secrets[i].infinity:
-            raise InvalidContributionError(i, "Participant sent invalid commitment")
-        # This can be optimized: We serialize the coms_to_secrets[i] here, but
-        # schnorr_verify (inside pop_verify) will need to deserialize it again, which
-        # involves computing a square root to obtain the y coordinate.
-        if not pop_verify(pops[i], coms_to_secrets[i].to_bytes_xonly(), i):
-            raise InvalidContributionError(
-                i, "Participant sent invalid proof-of-knowledge"
-            )
+    # Verify all pops at once, but report the same error as checking participants one
+    # by one would: the first invalid commitment or pop (whichever comes first) is blamed.
+    # The pops are verified against the decoded coms_to_secrets, which avoids serializing
+    # them and computing a square root to deserialize them again.
+    first_infinity = next(
+        (i for i in range(n) if i != idx and coms_to_secrets[i].infinity), n
+    )
+    # No need to check our own pop.
+    idxs = [i for i in range(first_infinity) if i != idx]
+    invalid = pop_batch_find_invalid(
+        [pops[i] for i in idxs], [coms_to_secrets[i] for i in idxs], idxs
+    )
+    if len(invalid) > 0:
+        raise InvalidContributionError(
+            idxs[invalid[0]], "Participant sent invalid proof-of-knowledge"
+        )
+    if first_infinity < n:
+        raise InvalidContributionError(
+            first_infinity, "Participant sent invalid commitment"
+        )
     sum_vss_commit = assemble_sum_vss_commitment(
         coms_to_secrets, sum_coms_to_nonconst_terms, n
     )
     if not sum_vss_commit.verify(idx, shares_sum):
         raise VSSVerifyError()
-    threshold_pubkey, signer_pubshares = common_dkg_output(sum_vss_commit, n)
+    threshold_pubkey, signer_pubshares = common_dkg_output(sum_vss_commit, n, lazy=True)
     eta = t.to_bytes(4, byteorder="big") + sum_vss_commit.to_bytes()
     return DKGOutput(shares_sum, threshold_pubkey, signer_pubshares), eta
 
@@ -199,11 +222,11 @@ def coordinator_step(
     # We cannot sum the commitments to the secrets because they'll be necessary
     # to check the PoPs.
     coms_to_secrets = [smsg.com.commitment_to_secret() for smsg in smsgs]
-    # But we can sum the commitments to the non-constant terms.
-    sum_coms_to_nonconst_terms = [
-        GE.sum(*(smsg.com.commitment_to_nonconst_terms()[j] for smsg in smsgs))
-        for j in range(0, t - 1)
-    ]
+    # But we can sum the commitments to the non-constant terms. Every column j holds the
+    # commitments to the j-th coefficients of all participants.
+    columns = zip(*(smsg.com.commitment_to_nonconst_terms() for smsg in smsgs))
+    sum_coms_to_nonconst_terms = GE.batch_sum(*columns)
+    assert len(sum_coms_to_nonconst_terms) == t - 1
     pops = [smsg.pop for smsg in smsgs]
     sum_vss_commit = assemble_sum_vss_commitment(
         coms_to_secrets, sum_coms_to_nonconst_terms, n
@@ -1,20 +1,202 @@
 from itertools import combinations
 from random import randint
 from typing import Tuple, List
+import hashlib
 import secrets
 import asyncio
-
-from secp256k1ref.secp256k1 import GE, G, Scalar
+import os
+import tempfile
+
+from secp256k1ref.secp256k1 import (
+    GE,
+    G,
+    Scalar,
+    FE,
+    FastGEMul,
+    APrimeFE,
+    APrimeIntFE,
+    DECODE_CACHE,
+)
 from secp256k1ref.keys import pubkey_gen_plain
+from secp256k1ref.scalarvec import ScalarVector
+from secp256k1ref import backend, bip340
+from secp256k1ref.ecdh import SharedPointCache
 
 from util import kdf
-from vss import Polynomial, VSS
+from vss import Polynomial, VSS, LazyPubshares
+from interpolation import interpolate_scalars, interpolate_points
 import simplpedpop
 import encpedpop
 import chilldkg
 from chilldkg import CoordinatorChannels, SignerChannel
 
 
+def test_field_impls():
+    # Both field implementations must agree with each other
+    class FracFE(APrimeFE):
+        SIZE = FE.SIZE
+
+    class IntFE(APrimeIntFE):
+        SIZE = FE.SIZE
+
+    for _ in range(32):
+        a, b, c = (randint(0, FE.SIZE - 1) for _ in range(3))
+        for X in (FracFE, IntFE):
+            x, y = X(a, b or 1), X(c)
+            assert int(x + y) == (a * pow(b or 1, -1, FE.SIZE) + c) % FE.SIZE
+            assert int((x - y) * x) == int((FracFE(a, b or 1) - c) * FracFE(a, b or 1))
+            assert int(-x + 5) == int(5 - x)
+            assert int(x**3) == int(x * x * x)
+            assert (x / y) * y == x
+            assert X.sum(x, y, x) == x + y + x
+            # Results of divisions, compared with the same values without a denominator
+            q, r = int(x / (a or 1)), (a * c) % FE.SIZE
+            assert x / (a or 1) == q and x / X(a or 1) == X(q)
+            assert int(2 - x / 3 + y / 7) == int(2 - X(int(x / 3)) + X(int(y / 7)))
+            assert X.sum(x / 3, y, x / 5) == X(int(x / 3)) + y + X(int(x / 5))
+            assert (x / 3) * (y / 5) * 15 == X(a, b or 1) * y == X(r, b or 1)
+        # Euler's criterion
+        assert IntFE(a).is_square() == (
+            pow(a, (FE.SIZE - 1) // 2, FE.SIZE) != FE.SIZE - 1
+        )
+        assert (FE(a).sqrt() is None) == (not FE(a).is_square())
+        assert (IntFE(a) / (b or 1)).is_square() == IntFE(
+            int(IntFE(a, b or 1))
+        ).is_square()
+
+
+def naive_mul(a: int, P: GE) -> GE:
+    # Double-and-add with affine group operations only
+    R = GE()
+    for i in range(255, -1, -1):
+        R = R + R
+        if (a >> i) & 1:
+            R = R + P
+    return R
+
+
+def test_scalar_mult():
+    with backend.use_backend(backend.FAST):
+        test_scalar_mult_internal()
+
+
+def test_scalar_mult_internal():
+    for _ in range(8):
+        a, b = randint(0, GE.ORDER - 1), randint(1, GE.ORDER - 1)
+        P = naive_mul(b, G)
+        aP, bG = naive_mul(a, P), naive_mul(b, G)
+        assert a * P == aP
+        assert b * G == bG
+        assert FastGEMul(P, window=4).mul(a) == aP
+        assert GE.batch_mul((a, P), (b, G)) == aP + bG
+        assert GE.batch_mul((a, P), (-a, P)).infinity
+        assert GE.sum(P, -P, G, G) == G + G
+        assert GE.batch_mul_fixed_scalar(a, [P, GE(), G, -P]) == [aP, GE(), a * G, -aP]
+        columns = [[P, G, aP], [], [P, -P, G], [G, GE(), G, bG, P]]
+        assert GE.batch_sum(*columns) == [GE.sum(*column) for column in columns]
+
+    # Affine additions leave the coordinates in fraction form
+    Ps = [G, G + G, GE(), G + G + G, -(G + G)]
+    assert GE.batch_to_bytes_compressed_with_infinity(Ps) == b"".join(
+        P.to_bytes_compressed_with_infinity() for P in Ps
+    )
+
+    assert GE.from_bytes_compressed((G + G).to_bytes_compressed()) == G + G
+    assert G + G != -(G + G)
+    assert GE() == GE() and G != GE() and GE() != G
+    assert GE.batch_add([G, G, G, GE(), G + G], [G, -G, GE(), GE(), G]) == [
+        G + G,
+        GE(),
+        G,
+        GE(),
+        G + G + G,
+    ]
+    assert len({G, G + G, (G + G) + GE(), G + GE()}) == 2
+
+    # Decoded points are cached
+    DECODE_CACHE.clear()
+    b = (G + G).to_bytes_compressed()
+    assert GE.from_bytes_compressed(b) == GE.from_bytes_compressed(b) == G + G
+    assert GE.from_bytes_xonly(b[1:]) == GE.from_bytes_xonly(b[1:])
+    assert DECODE_CACHE.stats()[:3] == (2, 2, 2)
+
+    # Tables can be stored and mapped into memory again
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "table.bin")
+        FastGEMul(P, window=3).save(path)
+        table = FastGEMul(P, window=3)
+        assert table.load(path)
+        assert table.mul(a) == aP
+        assert not FastGEMul(G, window=3).load(path)
+        assert not FastGEMul(P, window=4).load(path)
+
+        # Tampered entries are rejected even if the checksum matches
+        def tamper(k, x, y):
+            with open(path, "rb") as f:
+                data = bytearray(f.read())
+            start = FastGEMul.HEADER_SIZE + 64 * k
+            data[start : start + 64] = x.to_bytes(32, "big") + y.to_bytes(32, "big")
+            checksum = hashlib.sha256(data[FastGEMul.HEADER_SIZE :]).digest()
+            data[FastGEMul.HEADER_SIZE - 32 : FastGEMul.HEADER_SIZE] = checksum
+            tampered = os.path.join(tmpdir, "tampered.bin")
+            with open(tampered, "wb") as f:
+                f.write(data)
+            return FastGEMul(P, window=3).load(tampered)
+
+        x, y = table.table[1]
+        assert tamper(1, x, y)
+        assert not tamper(1, x, y + 1)
+        assert not tamper(0, x, y)
+
+        # Temporary files are removed if saving fails
+        os.mkdir(os.path.join(tmpdir, "dir"))
+        try:
+            FastGEMul(P, window=3).save(os.path.join(tmpdir, "dir"))
+            assert False
+        except OSError:
+            pass
+        assert sorted(os.listdir(tmpdir)) == ["dir", "table.bin", "tampered.bin"]
+
+    # Large enough to use Pippenger's algorithm
+    terms = [(randint(0, GE.ORDER - 1), randint(1, 4) * G) for _ in range(128)]
+    assert GE.batch_mul(*terms) == GE.sum(*(a * P for a, P in terms))
+
+
+def test_scalar_vector():
+    n = 5
+    rows = [[Scalar(randint(0, GE.ORDER - 1)) for _ in range(n)] for _ in range(3)]
+    a, b, c = (ScalarVector.from_scalars(row) for row in rows)
+    x = Scalar(randint(0, GE.ORDER - 1))
+    # Vector operands, and broadcast scalar and int operands on either side
+    assert a + b == [y + z for y, z in zip(rows[0], rows[1])]
+    assert a - b == [y - z for y, z in zip(rows[0], rows[1])]
+    assert a * b == [y * z for y, z in zip(rows[0], rows[1])]
+    assert a - x == [y - x for y in rows[0]]
+    assert x - a == [x - y for y in rows[0]]
+    assert 3 - a == [Scalar(3) - y for y in rows[0]]
+    assert x + a == a + x == [y + x for y in rows[0]]
+    assert 2 * a == a * Scalar(2) == [y + y for y in rows[0]]
+    assert -a == [-y for y in rows[0]]
+    assert ScalarVector.sum(a, b, c) == a + b + c
+    assert ScalarVector.sum(a, b, c) == [sum(col, Scalar(0)) for col in zip(*rows)]
+    assert a.total() == sum(rows[0], Scalar(0))
+    assert ScalarVector.zeros(n).total() == 0
+    assert (a + 1).inverse() * (a + 1) == [1] * n
+    # Assigned values are reduced
+    v = ScalarVector.zeros(n)
+    v[0] = GE.ORDER + 1
+    v[1] = -1
+    v[2] = x
+    assert v[0] == 1 and v[1] == -Scalar(1) and v[2] == x
+    assert v.values()[:3] == [1, GE.ORDER - 1, int(x)]
+    # Comparison with vectors, lists and tuples
+    assert a == ScalarVector(int(y) + GE.ORDER for y in rows[0])
+    assert a == rows[0] and a == tuple(rows[0])
+    assert a != rows[0][:-1] and a != b and a != rows[1]
+    assert a.to_bytes() == b"".join(y.to_bytes() for y in rows[0])
+    assert ScalarVector().to_bytes() == b""
+
+
 def test_vss_correctness():
     def rand_polynomial(t):
         return Polynomial([randint(1, GE.ORDER - 1) for _ in range(1, t + 1)])
@@ -25,8 +207,43 @@ def test_vss_correctness():
             vss = VSS(f)
             shares = vss.shares(n)
             assert len(shares) == n
+            assert shares == [vss.share_for(i) for i in range(n)]
             assert all(vss.commit().verify(i, shares[i]) for i in range(n))
 
+    # Pubshares by forward differences (with both backends)
+    for t in range(1, 5):
+        vss = VSS(rand_polynomial(t))
+        n = 2 * t + 1
+        shares = vss.shares(n)
+        for name in backend.BACKENDS:
+            with backend.use_backend(name):
+                assert vss.commit().pubshares(n) == [share * G for share in shares]
+                assert vss.commit().pubshare(n - 1) == shares[n - 1] * G
+                lazy = LazyPubshares(vss.commit(), n)
+                assert lazy[1] == lazy[-n + 1] == shares[1] * G
+                assert lazy[1:3] == [shares[1] * G, shares[2] * G]
+                assert [share * G for share in shares] == lazy
+                assert lazy.materialize() == vss.commit().pubshares(n)
+                # Materialize after all but a few pubshares have been computed individually
+                lazy = LazyPubshares(vss.commit(), n)
+                assert lazy[2:] == [share * G for share in list(shares)[2:]]
+                assert lazy == [share * G for share in shares]
+                assert vss.commit().batch_verify(range(n), shares)
+                # (For t = 1, all shares are identical.)
+                assert (t == 1) == vss.commit().batch_verify(range(1, n + 1), shares)
+                bad_shares = list(shares)
+                bad_shares[n // 2] += 1
+                assert not vss.commit().batch_verify(range(n), bad_shares)
+                assert not vss.commit().verify(n // 2, bad_shares[n // 2])
+
+    # Pubshares of a polynomial of lower degree, whose last differences are infinity
+    f = Polynomial([Scalar(5), Scalar(7), Scalar(0)])
+    for name in backend.BACKENDS:
+        with backend.use_backend(name):
+            assert VSS(f).commit().pubshares(6) == [
+                f(Scalar(x)) * G for x in range(1, 7)
+            ]
+
 
 def simulate_simplpedpop(seeds, t) -> List[Tuple[simplpedpop.DKGOutput, bytes]]:
     n = len(seeds)
@@ -45,6 +262,129 @@ def simulate_simplpedpop(seeds, t) -> List[Tuple[simplpedpop.DKGOutput, bytes]]:
     return pre_finalize_outputs
 
 
+def test_verified_sig_cache():
+    seckey = bytes([1]) * 32
+    pubkey = bip340.pubkey_gen(seckey)
+    sig = bip340.schnorr_sign(b"msg", seckey, bytes(32))
+    bad_sig = sig[0:32] + bytes(32)
+    with backend.use_backend(backend.FAST):
+        bip340.VERIFIED_SIGS.clear()
+        assert bip340.schnorr_verify(b"msg", pubkey, sig)
+        assert not bip340.schnorr_verify(b"msg", pubkey, bad_sig)
+        assert bip340.schnorr_verify(b"msg", pubkey, sig)
+        assert not bip340.schnorr_verify(b"msg", pubkey, bad_sig)
+        # Only the valid signature is cached, so only its second verification hits
+        assert bip340.VERIFIED_SIGS.stats()[:3] == (1, 3, 1)
+        assert bip340.schnorr_batch_verify([b"msg"], [pubkey], [sig])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "sigs.bin")
+            bip340.VERIFIED_SIGS.save(path)
+            cache = bip340.VerifiedSignatureCache()
+            assert cache.load(path)
+            assert cache.contains(b"msg", pubkey, sig)
+            assert not cache.contains(b"msg", pubkey, bad_sig)
+            with open(path, "r+b") as f:
+                f.seek(-1, os.SEEK_END)
+                f.write(b"\x00")
+            assert not bip340.VerifiedSignatureCache().load(path)
+
+
+def test_shared_point_cache():
+    (deckey0, enckey0), (deckey1, enckey1) = [
+        encpedpop_keys(bytes([i]) * 32) for i in range(2)
+    ]
+    shared = (
+        Scalar.from_bytes(deckey0) * GE.from_bytes_compressed(enckey1)
+    ).to_bytes_compressed()
+    cache = SharedPointCache(maxsize=1)
+    assert cache.get_or_compute(deckey0, enckey0, enckey1) == shared
+    assert cache.get_or_compute(deckey0, enckey0, enckey1) == shared
+    # A different deckey for the same enckey does not hit
+    assert cache.get_or_compute(deckey1, enckey0, enckey1) != shared
+    assert cache.stats()[:3] == (1, 2, 1)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "ecdh.bin")
+        cache.save(path)
+        assert os.stat(path).st_mode & 0o777 == 0o600
+        loaded = SharedPointCache()
+        assert loaded.load(path)
+        assert loaded.get_or_compute(deckey1, enckey0, enckey1) != shared
+        assert loaded.stats()[:3] == (1, 0, 1)
+
+    # An entry evicted by another thread right after it has been looked up is still returned
+    # intact, as it is copied before the lookup releases the lock.
+    racy = SharedPointCache(maxsize=1)
+    racy.get_or_compute(deckey0, enckey0, enckey1)
+    lookup = racy._cache.get
+
+    def get_then_evict(key, *args, **kwargs):
+        value = lookup(key, *args, **kwargs)
+        racy._cache.put(b"other", bytearray(33))
+        return value
+
+    racy._cache.get = get_then_evict  # type: ignore[method-assign]
+    assert racy.get_or_compute(deckey0, enckey0, enckey1) == shared
+    assert racy.get_or_compute_batch(deckey0, enckey0, [enckey1]) == [shared]
+
+    # Evicted and cleared entries are zeroized
+    [(_, point)] = cache._cache.items()
+    cache.get_or_compute(deckey1, enckey1, enckey0)
+    assert point == bytes(33)
+    [(_, point)] = cache._cache.items()
+    cache.clear()
+    assert point == bytes(33)
+
+
+def test_encpedpop_invalid_enckey():
+    (deckey0, enckey0), (_, enckey1) = [
+        encpedpop_keys(bytes([i]) * 32) for i in range(2)
+    ]
+    enckeys = [enckey0, enckey1, b"\x02" + bytes(32)]
+    for name in backend.BACKENDS:
+        with backend.use_backend(name):
+            # Invalid enckeys are reported with their index
+            try:
+                encpedpop.signer_step(bytes(32), 1, deckey0, enckeys, 0)
+                assert False
+            except encpedpop.InvalidContributionError as e:
+                assert e.signer == 2
+            try:
+                encpedpop.decrypt_sum(Scalar(0), deckey0, enckeys, 0, b"")
+                assert False
+            except ValueError:
+                pass
+
+
+def test_pop_blame():
+    t, n = 2, 4
+    seeds = [bytes([i]) * 32 for i in range(n)]
+    srets = [simplpedpop.signer_step(seeds[i], t, n, i) for i in range(n)]
+    cmsg, _, _ = simplpedpop.coordinator_step([sret[1] for sret in srets], t, n)
+    shares_sum = Scalar.sum(*([sret[2][0] for sret in srets]))
+    pops = list(cmsg.pops)
+    pops[2], pops[3] = pops[3], pops[2]
+    coms_to_secrets = list(cmsg.coms_to_secrets)
+    coms_to_secrets[3] = GE()
+    for name in backend.BACKENDS:
+        with backend.use_backend(name):
+            # Participant 2 comes first, so it is blamed for its invalid pop
+            bad_cmsg = cmsg._replace(pops=pops, coms_to_secrets=coms_to_secrets)
+            try:
+                simplpedpop.signer_pre_finalize(srets[0][0], bad_cmsg, shares_sum)
+                assert False
+            except simplpedpop.InvalidContributionError as e:
+                assert e.signer == 2
+            # Participant 1 sent an infinite commitment, which is detected first
+            bad_cmsg = bad_cmsg._replace(
+                coms_to_secrets=[coms_to_secrets[0], GE()] + coms_to_secrets[2:]
+            )
+            try:
+                simplpedpop.signer_pre_finalize(srets[0][0], bad_cmsg, shares_sum)
+                assert False
+            except simplpedpop.InvalidContributionError as e:
+                assert e.signer == 1
+
+
 def encpedpop_keys(seed: bytes) -> Tuple[bytes, bytes]:
     deckey = kdf(seed, "deckey")
     enckey = pubkey_gen_plain(deckey)
@@ -121,7 +461,10 @@ def simulate_chilldkg_full(
         coord_chans = CoordinatorChannels(n)
         signer_chans = [SignerChannel(coord_chans.queues[i]) for i in range(n)]
         coord_chans.set_signer_queues([signer_chans[i].queue for i in range(n)])
-        coroutines = [chilldkg.coordinator(coord_chans, params)] + [
+        # Use half-aggregated certificates here (simulate_chilldkg uses the plain format)
+        coroutines = [
+            chilldkg.coordinator(coord_chans, params, aggregate_cert=True)
+        ] + [
             chilldkg.signer(signer_chans[i], seeds[i], hostkeys[i][0], params)
             for i in range(n)
         ]
@@ -140,36 +483,159 @@ def simulate_chilldkg_full(
     ]
 
 
-def derive_interpolating_value(L, x_i):
-    assert x_i in L
-    assert all(L.count(x_j) <= 1 for x_j in L)
-    lam = Scalar(1)
-    for x_j in L:
-        x_j = Scalar(x_j)
-        x_i = Scalar(x_i)
-        if x_j == x_i:
-            continue
-        lam *= x_j / (x_j - x_i)
-    return lam
-
-
-def recover_secret(signer_indices, shares) -> Scalar:
-    interpolated_shares = []
-    t = len(shares)
-    assert len(signer_indices) == t
-    for i in range(t):
-        lam = derive_interpolating_value(signer_indices, signer_indices[i])
-        interpolated_shares += [(lam * shares[i])]
-    recovered_secret = Scalar.sum(*interpolated_shares)
-    return recovered_secret
-
-
 def test_recover_secret():
     f = Polynomial([23, 42])
     shares = [f(i) for i in [1, 2, 3]]
-    assert recover_secret([1, 2], [shares[0], shares[1]]) == f.coeffs[0]
-    assert recover_secret([1, 3], [shares[0], shares[2]]) == f.coeffs[0]
-    assert recover_secret([2, 3], [shares[1], shares[2]]) == f.coeffs[0]
+    for name in backend.BACKENDS:
+        with backend.use_backend(name):
+            assert interpolate_scalars([0, 1], [shares[0], shares[1]]) == f.coeffs[0]
+            assert interpolate_scalars([0, 2], [shares[0], shares[2]]) == f.coeffs[0]
+            assert interpolate_scalars([2, 1], [shares[2], shares[1]]) == f.coeffs[0]
+            assert (
+                interpolate_points([2, 0], [shares[2] * G, shares[0] * G])
+                == Scalar(23) * G
+            )
+
+
+def test_certifying_eq():
+    n = 5
+    hostkeys = [chilldkg.hostkey_gen(bytes([i]) * 32) for i in range(n)]
+    hostpubkeys = [hostpubkey for _, hostpubkey in hostkeys]
+    x = b"eta"
+    sigs = [chilldkg.certifying_eq_signer_step(sk, x) for sk, _ in hostkeys]
+    # Corrupt signature 1 (wrong message) and 3 (s out of range)
+    sigs[1] = chilldkg.certifying_eq_signer_step(hostkeys[1][0], b"other")
+    sigs[3] = sigs[3][0:32] + b"\xff" * 32
+    for name in backend.BACKENDS:
+        with backend.use_backend(name):
+            cert = chilldkg.certifying_eq_coordinator_step(sigs)
+            assert not chilldkg.certifying_eq_verify(hostpubkeys, x, cert)
+            assert chilldkg.certifying_eq_invalid_signers(hostpubkeys, x, cert) == [
+                1,
+                3,
+            ]
+            for bad_cert, culprit in [(cert, 1), (cert[:-1], None)]:
+                try:
+                    chilldkg.certifying_eq_blame(hostpubkeys, x, bad_cert)
+                    assert False
+                except chilldkg.InvalidContributionError as e:
+                    assert e.signer == culprit
+            valid = [sigs[i] for i in [0, 2, 4]]
+            cert = chilldkg.certifying_eq_coordinator_step(valid)
+            pks = [hostpubkeys[i] for i in [0, 2, 4]]
+            assert chilldkg.certifying_eq_verify(pks, x, cert)
+            assert chilldkg.certifying_eq_invalid_signers(pks, x, cert) == []
+            agg_cert = chilldkg.certifying_eq_coordinator_step_aggregate(pks, x, valid)
+            assert len(agg_cert) == 32 * 4
+            assert chilldkg.certifying_eq_verify(pks, x, agg_cert)
+            assert not chilldkg.certifying_eq_verify(pks, b"other", agg_cert)
+            assert not chilldkg.certifying_eq_verify(pks[::-1], x, agg_cert)
+            # For n = 1, the aggregate is the signature itself
+            assert (
+                chilldkg.certifying_eq_coordinator_step_aggregate(pks[:1], x, valid[:1])
+                == valid[0]
+            )
+
+
+def chilldkg_transcript(seeds, t) -> List[bytes]:
+    # Run all ChillDKG steps and return everything that is sent or output, serialized
+    n = len(seeds)
+    hostpubkeys = [chilldkg.hostkey_gen(seed)[1] for seed in seeds]
+    params, params_id = chilldkg.session_params(hostpubkeys, t, b"")
+    transcript = hostpubkeys + [params_id]
+
+    srets1 = [chilldkg.signer_step1(seed, params) for seed in seeds]
+    for _, smsg1 in srets1:
+        simpl_smsg, enc_shares = smsg1.enc_smsg
+        transcript += [simpl_smsg.com.to_bytes(), simpl_smsg.pop]
+        transcript += [share.to_bytes() for share in enc_shares]
+    cmsg, cout, ceta = chilldkg.coordinator_step([smsg1 for _, smsg1 in srets1], params)
+    transcript += [cmsg.enc_cmsg.simpl_cmsg.to_bytes(), ceta]
+    transcript += [share.to_bytes() for share in cmsg.enc_shares_sums]
+
+    srets2 = [chilldkg.signer_step2(seeds[i], srets1[i][0], cmsg) for i in range(n)]
+    transcript += [sret[0].eta for sret in srets2] + [sret[1] for sret in srets2]
+    cert = chilldkg.certifying_eq_coordinator_step([sret[1] for sret in srets2])
+    transcript += [cert]
+
+    for i in range(n):
+        out = chilldkg.signer_finalize(srets2[i][0], cert)
+        assert out is not None
+        ret = chilldkg.signer_recover(seeds[i], out[1], b"")
+        assert ret is not False
+        for secshare, threshold_pubkey, pubshares in (out[0], ret[0]):
+            assert secshare is not None
+            transcript += [secshare.to_bytes(), threshold_pubkey.to_bytes_compressed()]
+            transcript += [P.to_bytes_compressed() for P in pubshares]
+    return transcript
+
+
+def test_session_context():
+    t, n = 2, 3
+    seeds = [bytes([i]) * 32 for i in range(n)]
+    hostpubkeys = [chilldkg.hostkey_gen(seed)[1] for seed in seeds]
+    params, _ = chilldkg.session_params(hostpubkeys, t, b"")
+    # Decoding the hostpubkeys is optional
+    ctxs = [
+        chilldkg.session_context(seed, params, decode_hostpubkeys=i % 2 == 0)
+        for i, seed in enumerate(seeds)
+    ]
+    assert [ctx.idx for ctx in ctxs] == list(range(n))
+    assert ctxs[0].hostpubkey_points == [
+        GE.from_bytes_compressed(pk) for pk in hostpubkeys
+    ]
+    assert ctxs[1].hostpubkey_points is None
+    # The context must belong to the seed
+    try:
+        chilldkg.signer_step1(seeds[1], params, ctxs[0])
+        assert False
+    except ValueError:
+        pass
+    srets1 = [chilldkg.signer_step1(seeds[i], params, ctxs[i]) for i in range(n)]
+    cmsg, _, _ = chilldkg.coordinator_step([sret[1] for sret in srets1], params)
+    srets2 = [
+        chilldkg.signer_step2(seeds[i], srets1[i][0], cmsg, ctxs[i]) for i in range(n)
+    ]
+    try:
+        chilldkg.signer_step2(seeds[0], srets1[0][0], cmsg, ctxs[1])
+        assert False
+    except ValueError:
+        pass
+    cert = chilldkg.certifying_eq_coordinator_step([sret[1] for sret in srets2])
+    for i in range(n):
+        out = chilldkg.signer_finalize(srets2[i][0], cert, ctxs[i])
+        assert out is not None
+        assert chilldkg.signer_recover(seeds[i], out[1], b"", ctxs[i]) == (
+            out[0],
+            params,
+        )
+        assert chilldkg.signer_recover(seeds[i], out[1], b"") == (out[0], params)
+        try:
+            chilldkg.signer_recover(seeds[i], out[1], b"other", ctxs[i])
+            assert False
+        except chilldkg.InvalidBackupError:
+            pass
+        try:
+            chilldkg.signer_recover(seeds[(i + 1) % n], out[1], b"", ctxs[i])
+            assert False
+        except chilldkg.InvalidBackupError:
+            pass
+    try:
+        chilldkg.session_context(bytes([n]) * 32, params)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_backends_agree():
+    # Differential test: every protocol step must produce identical bytes with all backends
+    for t, n in [(1, 1), (2, 3)]:
+        seeds = [bytes([i]) * 32 for i in range(n)]
+        transcripts = []
+        for name in backend.BACKENDS:
+            with backend.use_backend(name):
+                transcripts += [chilldkg_transcript(seeds, t)]
+        assert all(transcript == transcripts[0] for transcript in transcripts)
 
 
 def test_correctness_internal(t, n, simulate_dkg):
@@ -199,9 +665,13 @@ def test_correctness_dkg_output(t, n, dkg_outputs: List[simplpedpop.DKGOutput]):
         assert secshares[i] * G == signer_pubshares[0][i]
 
     # Check that all combinations of t signers can recover the threshold pubkey
-    for tsubset in combinations(range(1, n + 1), t):
-        recovered_secret = recover_secret(tsubset, [secshares[i - 1] for i in tsubset])
+    for tsubset in combinations(range(n), t):
+        recovered_secret = interpolate_scalars(tsubset, [secshares[i] for i in tsubset])
         assert recovered_secret * G == threshold_pubkey
+        recovered_pubkey = interpolate_points(
+            tsubset, [signer_pubshares[0][i] for i in tsubset]
+        )
+        assert recovered_pubkey == threshold_pubkey
 
 
 def test_correctness_pre_finalize(t, n, simulate_dkg):
@@ -232,8 +702,18 @@ def test_correctness(t, n, simulate_dkg):
         assert signer_pubshares == dkg_outputs[i][2]
 
 
+test_field_impls()
+test_scalar_mult()
+test_scalar_vector()
 test_vss_correctness()
 test_recover_secret()
+test_certifying_eq()
+test_encpedpop_invalid_enckey()
+test_pop_blame()
+test_verified_sig_cache()
+test_shared_point_cache()
+test_session_context()
+test_backends_agree()
 for t, n in [(1, 1), (1, 2), (2, 2), (2, 3), (2, 5)]:
     test_correctness_pre_finalize(t, n, simulate_simplpedpop)
     test_correctness_pre_finalize(t, n, simulate_encpedpop)
@@ -20,3 +20,6 @@ ruff format --diff --quiet || true
 mypy --no-error-summary . || true
 
 python3 tests.py
+SECP256K1REF_FIELD=int python3 tests.py
+SECP256K1REF_BACKEND=fast python3 tests.py
+SECP256K1REF_BACKEND=fast SECP256K1REF_FIELD=int python3 tests.py
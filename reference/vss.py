@@ -1,8 +1,11 @@
-from typing import List, NamedTuple
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Union, overload
 
+from secp256k1ref import backend
 from secp256k1ref.secp256k1 import GE, G, Scalar
+from secp256k1ref.scalarvec import ScalarVector
+from secp256k1ref.util import int_from_bytes, hash_sha256
 
-from util import kdf, DeserializationError
+from util import kdf, tagged_hash_bip_dkg, DeserializationError
 
 
 class VSSVerifyError(Exception):
@@ -30,6 +33,35 @@ class Polynomial(NamedTuple):
     def __call__(self, x: Scalar) -> Scalar:
         return self.eval(x)
 
+    def eval_range(self, n: int) -> ScalarVector:
+        """Evaluate a polynomial at positions 1, ..., n.
+
+        This uses forward differences on plain integers: f(x) is the first of the differences
+        d_k = (Δ^k f)(x) for k = 0..t-1, and the differences at x+1 are d_k + d_{k+1} (with
+        d_{t-1} constant). After evaluating f at 1..t to obtain the differences at x = 1, every
+        further evaluation costs only t-1 additions."""
+        t = len(self.coeffs)
+        coeffs = [int(c) for c in self.coeffs[::-1]]
+        values = []
+        for x in range(1, min(n, t) + 1):
+            value = 0
+            for coeff in coeffs:
+                value = (value * x + coeff) % Scalar.SIZE
+            values.append(value)
+        if n <= t:
+            return ScalarVector(values)
+        # Difference table at x = 1
+        diffs = []
+        while len(values) > 0:
+            diffs.append(values[0])
+            values = [b - a for a, b in zip(values, values[1:])]
+        values = [diffs[0]]
+        while len(values) < n:
+            for k in range(t - 1):
+                diffs[k] = (diffs[k] + diffs[k + 1]) % Scalar.SIZE
+            values.append(diffs[0])
+        return ScalarVector(values)
+
 
 class VSSCommitment(NamedTuple):
     ges: List[GE]
@@ -38,15 +70,73 @@ class VSSCommitment(NamedTuple):
         return len(self.ges)
 
     def verify(self, i: int, share: Scalar) -> bool:
-        P = share * G
-        Q = GE.batch_mul(
-            *(((i + 1) ** j, self.ges[j]) for j in range(0, len(self.ges)))
+        return share * G == self.pubshare(i)
+
+    def batch_verify(self, idxs: Sequence[int], shares: Sequence[Scalar]) -> bool:
+        """Verify the shares of the signers with indices idxs at once.
+
+        With the fast backend, this checks a random linear combination of the individual checks,
+        sum(a_k * shares[k]) * G == sum(a_k * F(idxs[k]+1)), which is a single multi-scalar
+        multiplication with t+1 terms. The randomizers are derived from all inputs."""
+        assert len(idxs) == len(shares)
+        if not backend.is_fast():
+            return all(self.verify(i, share) for i, share in zip(idxs, shares))
+        seed = tagged_hash_bip_dkg(
+            "VSS batch verify",
+            self.to_bytes()
+            + b"".join(
+                i.to_bytes(4, "big") + share.to_bytes()
+                for i, share in zip(idxs, shares)
+            ),
         )
-        return P == Q
+        share_sum = 0
+        # coeff_sums[j] = sum(a_k * (idxs[k]+1)^j)
+        coeff_sums = [0] * self.t()
+        for k, (i, share) in enumerate(zip(idxs, shares)):
+            a = (
+                1
+                if k == 0
+                else int_from_bytes(hash_sha256(seed + k.to_bytes(4, "big")))
+            )
+            share_sum += a * int(share)
+            for j in range(self.t()):
+                coeff_sums[j] += a
+                a = a * (i + 1) % GE.ORDER
+        return GE.batch_mul((-share_sum, G), *zip(coeff_sums, self.ges)).infinity
+
+    def pubshare(self, i: int) -> GE:
+        """Return the public share of the signer with index i.
+
+        This computes F(i+1) = f(i+1) * G, where F is the polynomial in the exponent, by Horner's
+        method with small multiplications by i+1 (see GE.eval_poly)."""
+        return GE.eval_poly(self.ges, i + 1)
+
+    def pubshares(self, n: int) -> List[GE]:
+        """Return the public shares of the signers with indices 0..n-1.
+
+        This computes [F(1), ..., F(n)] by forward differences: F(x) is the first of the
+        differences D_k = (Δ^k F)(x) for k = 0..t-1, and the differences at x+1 are D_k + D_{k+1}
+        (with D_{t-1} constant). The differences at x = 1 are obtained from F(1), ..., F(t) (see
+        pubshare), and every further pubshare costs only t-1 point additions, which are done in
+        a single batch (see GE.batch_add)."""
+        t = self.t()
+        values = [self.pubshare(i) for i in range(min(n, t))]
+        if n <= t:
+            return values
+        # Difference table at x = 1
+        diffs = []
+        while len(values) > 0:
+            diffs.append(values[0])
+            values = GE.batch_add(values[1:], [-p for p in values[:-1]])
+        pubshares = [diffs[0]]
+        while len(pubshares) < n:
+            diffs = GE.batch_add(diffs[:-1], diffs[1:]) + diffs[-1:]
+            pubshares.append(diffs[0])
+        return pubshares
 
     # Returns commitments to the coefficients of f
     def to_bytes(self) -> bytes:
-        return b"".join([P.to_bytes_compressed_with_infinity() for P in self.ges])
+        return GE.batch_to_bytes_compressed_with_infinity(self.ges)
 
     def __add__(self, other):
         assert self.t() == other.t()
@@ -66,6 +156,70 @@ class VSSCommitment(NamedTuple):
         return self.ges[1 : self.t()]
 
 
+class LazyPubshares(Sequence[GE]):
+    """The public shares of the signers with indices 0..n-1, computed on demand.
+
+    Accessing the i-th element computes VSSCommitment.pubshare(i) and caches it. Iterating over
+    (or comparing) the sequence materializes all elements, see materialize()."""
+
+    def __init__(self, vss_commit: VSSCommitment, n: int):
+        self.vss_commit = vss_commit
+        self.n = n
+        self._pubshares: List[Optional[GE]] = [None] * n
+        self._materialized = False
+
+    def __len__(self) -> int:
+        return self.n
+
+    @overload
+    def __getitem__(self, i: int) -> GE: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List[GE]: ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[GE, List[GE]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.n))]
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError("pubshare index out of range")
+        pubshare = self._pubshares[i]
+        if pubshare is None:
+            pubshare = self.vss_commit.pubshare(i)
+            self._pubshares[i] = pubshare
+        return pubshare
+
+    def materialize(self) -> List[GE]:
+        """Compute all pubshares (if not done yet) and return them as a list.
+
+        The bulk method VSSCommitment.pubshares(n) evaluates t pubshares individually anyway,
+        so it is used only if more than t pubshares are missing. Otherwise, the missing ones
+        are computed individually."""
+        if not self._materialized:
+            missing = [i for i in range(self.n) if self._pubshares[i] is None]
+            if len(missing) > self.vss_commit.t():
+                self._pubshares = list(self.vss_commit.pubshares(self.n))
+            else:
+                for i in missing:
+                    self._pubshares[i] = self.vss_commit.pubshare(i)
+            self._materialized = True
+        return list(self._pubshares)  # type: ignore[arg-type]
+
+    def __iter__(self) -> Iterator[GE]:
+        return iter(self.materialize())
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (LazyPubshares, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and self.materialize() == list(other)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"LazyPubshares({self.materialize()!r})"
+
+
 class VSS(NamedTuple):
     f: Polynomial
 
@@ -85,11 +239,11 @@ class VSS(NamedTuple):
         assert x != Scalar(0)  # Ensure we don't compute f(0), which is the secret.
         return self.f(x)
 
-    def shares(self, n: int) -> List[Scalar]:
+    def shares(self, n: int) -> ScalarVector:
         """Return the secret shares to be sent to signers with indices 0..n-1.
 
-        This computes [f(1), ..., f(n)]."""
-        return [self.share_for(i) for i in range(0, n)]
+        This computes [f(1), ..., f(n)], see Polynomial.eval_range."""
+        return self.f.eval_range(n)
 
     def commit(self) -> VSSCommitment:
         return VSSCommitment([c * G for c in self.f.coeffs])